@@ -30,11 +30,27 @@ STAY_WITHIN_MAP = True
 # ensure that you visit within this many meters of every part of your map during bootstrap
 # lower values are more thorough but will take longer
 BOOTSTRAP_RADIUS = 120
+# During bootstrap phase 2, only visit 1 in every x points in areas where the
+# nearest phase 1 visit saw nothing. 1 to visit every point.
+#BOOTSTRAP_SPARSE = 3
 
 GIVE_UP_KNOWN = 75   # try to find a worker for a known spawn for this many seconds before giving up
 GIVE_UP_UNKNOWN = 60 # try to find a worker for an unknown point for this many seconds before giving up
 SKIP_SPAWN = 90      # don't even try to find a worker for a spawn if the spawn time was more than this many seconds ago
 
+# Retry skipped spawns that will remain for at least this many more seconds,
+# soonest to despawn first, whenever a worker is free. 0 to disable.
+#CATCH_UP = 120
+
+# Don't visit a known spawn if another visit since it spawned was within 70m
+# of it. Also shows how recently each part of the map was scanned.
+#SKIP_FRESH = False
+
+# Send the timestamp of each cell's last response in GetMapObjects requests,
+# so that unchanged forts are left out. Forts are merged into a per-cell cache
+# for processing. Average response size and timings are shown in the status.
+#DELTA_GMO = False
+
 # How often should the mystery queue be reloaded (default 90s)
 # this will reduce the grouping of workers around the last few mysteries
 #RESCAN_UNKNOWN = 90
@@ -42,6 +58,11 @@ SKIP_SPAWN = 90      # don't even try to find a worker for a spawn if the spawn
 # filename of accounts CSV
 ACCOUNTS_CSV = 'accounts.csv'
 
+# Keep up to this many spare accounts in the scanner process, so that swaps
+# don't wait on the manager. The rest are moved to the manager's queue in the
+# background, where solve_captchas.py and other shards can get them.
+#ACCOUNT_POOL = 20
+
 # the directory that the pickles folder, socket, CSV, etc. will go in
 # defaults to working directory if not set
 #DIRECTORY = None
@@ -55,6 +76,20 @@ SIMULTANEOUS_LOGINS = 4
 # Limit the number of workers simulating the app startup process simultaneously.
 SIMULTANEOUS_SIMULATION = 10
 
+# Keep this many spare accounts logged in and through the app simulation, so
+# that a swapped worker can take one and scan right away. Their tokens are
+# renewed before they expire.
+#WARM_POOL = 0
+
+# Log idle workers in again this many seconds before their token expires,
+# instead of losing a visit when a request fails with an expired token.
+#TOKEN_REFRESH = 600
+
+# Cancel a visit, login, encounter or CAPTCHA that is still running after this
+# many seconds, so a hung request doesn't keep the worker busy forever. Leave
+# room for slow logins and CAPTCHA solving.
+#WATCHDOG = 300
+
 # Immediately select workers whose speed are below (SPEED_UNIT)p/h instead of
 # continuing to try to find the worker with the lowest speed.
 # May increase clustering if you have a high density of workers.
@@ -81,6 +116,12 @@ SEARCH_SLEEP = 2.5
 # value: how many requests to keep as spare (0.1 = 10%), False to disable
 #SMART_THROTTLE = 0.1
 
+# Meter every request from all workers against the hashing quota. When hashes
+# run short, GMO requests for known spawns go first, then other GMO requests,
+# encounters, PokéStop spins, gym info and egg incubation. Workers wait for
+# their turn instead of sleeping until the quota resets.
+#HASH_SCHEDULER = False
+
 # Swap the worker that has seen the fewest Pokémon every x seconds
 # Defaults to whatever will allow every worker to be swapped within 6 hours
 #SWAP_OLDEST = 300  # 5 minutes
@@ -100,6 +141,10 @@ INCUBATE_EGGS = True        # incubate eggs if available
 #ENCOUNTER = 'notifying'
 ENCOUNTER = 'some'
 ENCOUNTER_IDS = { 201 }
+# Hand encounters over to idle nearby workers instead of encountering them
+# during the visit. If no worker can get there within this many seconds (or
+# before it despawns), the Pokémon is saved without IVs. 0 to disable.
+#ENCOUNTER_QUEUE = 60
 
 # PokéStops
 SPIN_POKESTOPS = True # spin all PokéStops that are within range
@@ -188,6 +233,11 @@ LAST_MIGRATION = 1496448000 # June 3, 2017
 # Treat a spawn point's expiration time as unknown if nothing is seen at it on more than x consecutive visits
 FAILURES_ALLOWED = 3
 
+# Infer the expiration times of unknown spawn points from their mystery
+# sightings every time spawns are reloaded (hourly). Can also be run manually
+# with scripts/infer_spawns.py
+#INFER_SPAWNS = False
+
 ## Map data provider and appearance, previews available at:
 ## https://leaflet-extras.github.io/leaflet-providers/preview/
 #MAP_PROVIDER_URL = '//{s}.tile.openstreetmap.org/{z}/{x}/{y}.png'
@@ -195,6 +245,8 @@ FAILURES_ALLOWED = 3
 
 # set of proxy addresses and ports
 # SOCKS requires aiosocks to be installed
+# Faster and more reliable proxies are picked more often, ones that keep
+# failing or get IP banned are left out for a while.
 #PROXIES = {'http://127.0.0.1:8080', 'https://127.0.0.1:8443', 'socks5://127.0.0.1:1080'}
 
 # convert spawn_id to integer for more efficient DB storage, set to False if
@@ -208,6 +260,24 @@ FAILURES_ALLOWED = 3
 #MANAGER_ADDRESS = 'monocle.sock'       # the socket name for Unix systems
 #MANAGER_ADDRESS = ('127.0.0.1', 5002)    # could be used for CAPTCHA solving and live worker maps on remote systems
 
+# Running scan.py --shards 4 splits the area into 4 strips from west to east,
+# each scanned by its own process with a share of the GRID workers. Accounts
+# are shared through the manager and the status screen shows all shards.
+# Each shard logs to scan-shard#.log and keeps its own pickles. There can't be
+# more shards than GRID workers. Shards share the database but not their
+# sighting caches. A Pokémon seen by two shards near a boundary is usually
+# found in the database before it's saved again. If both save it at the same
+# moment, the unique constraint on sightings rejects the second copy.
+#
+# Other hosts can scan some of the regions: run scan.py --shards 4 --processes 2
+# with a MANAGER_ADDRESS tuple reachable from them, and scan.py --join HOST:PORT
+# --processes 2 on another host with the same AUTHKEY. Regions are leased,
+# a region whose process stops sending heartbeats for this many seconds can
+# be claimed by another and its accounts are used again, as they were when
+# last sent, up to a quarter of the lease ago. Stop the host that runs
+# --shards last, the others can't continue without it.
+#SHARD_LEASE = 120
+
 # Store the cell IDs so that they don't have to be recalculated every visit.
 # Highly recommended unless you don't have enough memory for them.
 # Disabling will increase processor usage.
@@ -222,6 +292,40 @@ FAILURES_ALLOWED = 3
 # The number of coroutines that are allowed to run simultaneously.
 #COROUTINES_LIMIT = GRID[0] * GRID[1]
 
+# Tune the coroutine limit between (minimum, maximum) based on visit latency,
+# skipped spawns, remaining hashes and event loop lag, starting from
+# COROUTINES_LIMIT. The current limit is shown in the status output.
+#ADAPTIVE_COROUTINES = (GRID[0] * GRID[1], GRID[0] * GRID[1] * 4)
+
+# Threads for blocking I/O like database queries and manager calls, and
+# processes for CPU heavy work like clustering spawn points. Their queue
+# lengths and timings are shown in the status output.
+#IO_THREADS = 4
+#CPU_PROCESSES = 1
+
+# Space out visits by each account between SCAN_DELAY and this many seconds
+# based on its recent empty responses, errors and timeouts, and back off
+# longer after errors on struggling accounts.
+#MAX_SCAN_DELAY = 30
+
+# Assign points to per-worker queues of this size instead of launching a
+# coroutine for every point. Each worker consumes its own queue, so the number
+# of coroutines stays equal to the number of workers. 0 to disable.
+#WORKER_QUEUES = 3
+
+# Place workers without a saved location at the centers of spawn clusters
+# (weighted k-means over known spawns) instead of an even grid.
+#DENSITY_PLACEMENT = False
+
+# Every x seconds, move workers that have been idle that long toward areas
+# where spawns were recently skipped. 0 to disable.
+#REBALANCE_INTERVAL = 300
+
+# Start with GRID[0] * GRID[1] workers, then every minute add workers from the
+# extra accounts while spawns are being skipped, or retire the longest running
+# idle ones, staying between (minimum, maximum).
+#ELASTIC_WORKERS = (GRID[0] * GRID[1] // 2, GRID[0] * GRID[1] * 2)
+
 ### FRONTEND CONFIGURATION
 LOAD_CUSTOM_HTML_FILE = False # File path MUST be 'templates/custom.html'
 LOAD_CUSTOM_CSS_FILE = False  # File path MUST be 'static/css/custom.css'
@@ -382,6 +486,10 @@ GYM_WEBHOOK = False
 ## Pull Gym name to populate Gym Table. This will populate a gym name cache upon initial startup. When set to true, consider clearing the fort DB from time to time as well as cache files. To clear fort DB, do so in this order: TRUNCATE fort_raids; TRUNCATE fort_sightings; TRUNCATE forts;. Then delete fort_names.pickle, forts.pickle, raids.pickle
 PULL_GYM_NAME = True
 
+## Fetch Gym names in the background with idle workers instead of during the
+## visit. Each worker fetches at most one every GYM_COOLDOWN seconds.
+#GYM_INFO_QUEUE = False
+
 ## Show raid timers by default above raid icons
 SHOW_RAID_TIMER = False
 
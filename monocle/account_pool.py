@@ -0,0 +1,144 @@
+from asyncio import CancelledError, Event, TimeoutError, wait_for
+from collections import deque
+from queue import Empty
+
+from .shared import get_logger, run_threaded, LOOP
+
+
+class AccountPool:
+    """Accounts kept in this process, mirrored to a manager queue
+
+    Used like the queue it wraps, but getting and putting accounts doesn't
+    wait on the manager. Up to keep accounts stay in a local deque, surplus
+    ones are moved to the manager queue in the background, and it's drawn
+    from when the deque runs low. solve_captchas.py and other shards keep
+    using the manager queue directly.
+
+    qsize() and empty() count the manager queue as of the last sync, which
+    is up to interval seconds old. count() asks the manager.
+    """
+    def __init__(self, queue, keep, interval=1.0):
+        self.queue = queue
+        self.keep = keep
+        # seconds between syncs with the manager when nothing changed
+        self.interval = interval
+        self.accounts = deque()
+        # size of the manager queue at the last sync
+        self.remote = 0
+        self.waiters = deque()
+        self.wakeup = Event(loop=LOOP)
+        self.running = True
+        self.log = get_logger('account_pool')
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def qsize(self):
+        """Approximate number of accounts, here and in the manager queue"""
+        return len(self.accounts) + self.remote
+
+    def empty(self):
+        """Approximate, like qsize()"""
+        return not self.accounts and not self.remote
+
+    async def count(self):
+        """Returns the number of accounts, asking the manager for its part"""
+        self.remote = await run_threaded(self.queue.qsize)
+        return len(self.accounts) + self.remote
+
+    def put(self, account):
+        while self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(account)
+                return
+        self.accounts.append(account)
+        if len(self.accounts) > self.keep:
+            self.wakeup.set()
+
+    def get_nowait(self):
+        """Returns an account, from the manager if there are none here"""
+        try:
+            account = self.accounts.popleft()
+        except IndexError:
+            # raises Empty like Queue.get_nowait
+            account = self.queue.get_nowait()
+            self.remote = max(self.remote - 1, 0)
+        if len(self.accounts) < self.keep:
+            self.wakeup.set()
+        return account
+
+    async def get(self):
+        try:
+            return self.accounts.popleft()
+        except IndexError:
+            pass
+        finally:
+            if len(self.accounts) < self.keep:
+                self.wakeup.set()
+        future = LOOP.create_future()
+        self.waiters.append(future)
+        self.wakeup.set()
+        try:
+            return await future
+        except CancelledError:
+            if future.done() and not future.cancelled():
+                # don't lose an account handed over just before cancellation
+                self.accounts.appendleft(future.result())
+            raise
+
+    def full_wait(self, maxsize=0, timeout=None):
+        """Block until there are fewer than maxsize accounts in total"""
+        return self.queue.full_wait(max(maxsize - len(self.accounts), 1), timeout)
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    async def run(self):
+        while self.running:
+            try:
+                await wait_for(self.wakeup.wait(), self.interval, loop=LOOP)
+            except TimeoutError:
+                pass
+            self.wakeup.clear()
+            surplus = []
+            while len(self.accounts) > self.keep:
+                surplus.append(self.accounts.pop())
+            wanted = self.keep - len(self.accounts) + len(self.waiters)
+            fetched = []
+            try:
+                self.remote = await run_threaded(self.exchange, surplus, fetched, wanted)
+            except CancelledError:
+                raise
+            except Exception as e:
+                self.log.warning('{} while syncing with the manager.', e.__class__.__name__)
+                # keep whatever didn't make it
+                self.accounts.extend(surplus)
+            for account in fetched:
+                self.put(account)
+
+    def exchange(self, surplus, fetched, wanted):
+        """Send surplus accounts and fetch wanted ones, in the executor"""
+        while surplus:
+            self.queue.put(surplus[-1])
+            surplus.pop()
+        try:
+            while len(fetched) < wanted:
+                fetched.append(self.queue.get_nowait())
+        except Empty:
+            pass
+        return self.queue.qsize()
+
+    def flush(self):
+        """Move every account to the manager queue"""
+        while self.accounts:
+            self.queue.put(self.accounts.popleft())
+
+    def drain(self):
+        """Yield every account, from here and the manager queue"""
+        while self.accounts:
+            yield self.accounts.popleft()
+        while not self.queue.empty():
+            yield self.queue.get()
+        self.remote = 0
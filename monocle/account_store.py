@@ -0,0 +1,81 @@
+import sqlite3
+
+from pickle import dumps, loads, HIGHEST_PROTOCOL
+from threading import Lock
+
+
+class AccountStore(dict):
+    """Accounts by username, saved to an SQLite table as they change
+
+    Setting or deleting an account marks it dirty. snapshot() serializes the
+    dirty accounts, which is cheap enough to do on the event loop so that
+    nothing changes them halfway through, and write() saves them in one
+    transaction from any thread. Only the loop touches dirty, so rows that
+    failed to save are handed back to it with retry().
+    """
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.dirty = set()
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('CREATE TABLE IF NOT EXISTS accounts '
+                            '(username TEXT PRIMARY KEY, account BLOB NOT NULL)')
+
+    def __setitem__(self, username, account):
+        super().__setitem__(username, account)
+        self.dirty.add(username)
+
+    def __delitem__(self, username):
+        super().__delitem__(username)
+        self.dirty.add(username)
+
+    def update(self, *args, **kwargs):
+        for username, account in dict(*args, **kwargs).items():
+            self[username] = account
+
+    def load(self):
+        """Returns the saved accounts, None if there are none"""
+        with self.lock:
+            rows = self.db.execute('SELECT username, account FROM accounts').fetchall()
+        return {username: loads(account) for username, account in rows} or None
+
+    def replace(self, accounts, save=True):
+        """Use accounts instead of the current ones, saving them all if save"""
+        super().clear()
+        super().update(accounts)
+        self.dirty.clear()
+        if save:
+            rows = [(username, dumps(account, HIGHEST_PROTOCOL))
+                    for username, account in accounts.items()]
+            with self.lock, self.db:
+                self.db.execute('DELETE FROM accounts')
+                self.db.executemany('INSERT INTO accounts VALUES (?, ?)', rows)
+
+    def snapshot(self):
+        """Returns the dirty accounts serialized, and marks them clean"""
+        rows = []
+        for username in self.dirty:
+            account = self.get(username)
+            rows.append((username, None if account is None
+                         else dumps(account, HIGHEST_PROTOCOL)))
+        self.dirty.clear()
+        return rows
+
+    def write(self, rows):
+        if not rows:
+            return
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO accounts VALUES (?, ?)',
+                                [row for row in rows if row[1] is not None])
+            self.db.executemany('DELETE FROM accounts WHERE username = ?',
+                                [(row[0],) for row in rows if row[1] is None])
+
+    def retry(self, rows):
+        """Mark the accounts of rows that weren't written dirty again"""
+        self.dirty.update(row[0] for row in rows)
+
+    def flush(self):
+        self.write(self.snapshot())
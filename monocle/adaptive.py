@@ -0,0 +1,100 @@
+from asyncio import CancelledError
+from collections import deque
+
+
+class AdaptiveSemaphore:
+    """Semaphore whose limit is tuned by additive increase, multiplicative decrease
+
+    Usable anywhere an asyncio.Semaphore is, the limit is adjusted by calling
+    adjust() periodically with signals about how the scanner is coping. A
+    lower limit only stops new acquisitions, running holders are unaffected.
+    """
+    def __init__(self, value, minimum, maximum, *, loop):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(value, minimum), maximum)
+        self.step = max(1, minimum // 10)
+        self.active = 0
+        self.reason = 'initial'
+        # typical visit latency, tracked slowly so that spikes stand out
+        self.baseline = None
+        self._waiters = deque()
+        self._loop = loop
+
+    def __str__(self):
+        return 'Concurrency limit: {}, active: {}, waiting: {} ({})'.format(
+            self.limit, self.active, len(self._waiters), self.reason)
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def locked(self):
+        return self.active >= self.limit
+
+    async def acquire(self):
+        if not self._waiters and self.active < self.limit:
+            self.active += 1
+            return True
+        future = self._loop.create_future()
+        self._waiters.append(future)
+        try:
+            # the slot is handed over by _wake before the result is set
+            return await future
+        except CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.active < self.limit:
+            future = self._waiters.popleft()
+            if not future.done():
+                self.active += 1
+                future.set_result(True)
+
+    def adjust(self, latency, skip_rate, headroom, lag):
+        """Change the limit based on the latest signals
+
+        latency: median visit time in seconds, None without visits
+        skip_rate: fraction of spawns skipped
+        headroom: fraction of the hash quota left, None if unknown
+        lag: seconds the event loop was late to run the last adjustment
+        """
+        if lag > 0.5:
+            self.decrease('event loop {:.2f}s behind'.format(lag))
+        elif headroom is not None and headroom < 0.1:
+            self.decrease('{:.0%} of hashes left'.format(headroom))
+        elif latency and self.baseline and latency > self.baseline * 2:
+            self.decrease('visits taking {:.1f}s, usually {:.1f}s'.format(
+                latency, self.baseline))
+        elif skip_rate > 0.01 and self._waiters:
+            self.increase('skipping {:.1%} while saturated'.format(skip_rate))
+        else:
+            self.reason = 'steady'
+
+        if latency:
+            if self.baseline is None:
+                self.baseline = latency
+            else:
+                self.baseline = self.baseline * 0.95 + latency * 0.05
+        self._wake()
+
+    def increase(self, reason):
+        self.limit = min(self.limit + self.step, self.maximum)
+        self.reason = 'raised: ' + reason
+
+    def decrease(self, reason):
+        self.limit = max(int(self.limit * 0.75), self.minimum)
+        self.reason = 'lowered: ' + reason
@@ -118,10 +118,9 @@ class Altitudes:
         elif state['precision'] <= conf.ALT_PRECISION:
             pickled_alts = state['altitudes']
 
-            to_remove = []
-            for coords in pickled_alts.keys():
-                if coords not in bounds:
-                    to_remove.append(coords)
+            points = list(pickled_alts.keys())
+            to_remove = [coords for coords, inside in
+                         zip(points, bounds.contains_many(points)) if not inside]
             for key in to_remove:
                 del pickled_alts[key]
 
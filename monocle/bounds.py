@@ -1,6 +1,6 @@
 import sys
 
-from . import sanitized as conf
+from . import shards, sanitized as conf
 from .utils import get_distance
 
 
@@ -24,6 +24,10 @@ class Bounds:
     def __hash__(self):
         return 0
 
+    def contains_many(self, points):
+        """Returns a list of booleans for whether each point is within bounds"""
+        return [True] * len(points)
+
     @property
     def area(self):
         """Returns the square kilometers for configured scan area"""
@@ -33,19 +37,64 @@ class Bounds:
 
 
 class PolyBounds(Bounds):
-    def __init__(self, polygon=conf.BOUNDARIES):
+    OUTSIDE, INSIDE, EDGE = 0, 1, 2
+
+    def __init__(self, polygon=conf.BOUNDARIES, size=64):
         self.boundaries = prep(polygon)
         self.south, self.west, self.north, self.east = polygon.bounds
         self.center = polygon.centroid.coords[0]
         self.multi = False
         self.polygon = polygon
 
+        # raster of the bounding box, only EDGE cells need the exact test
+        self.size = size
+        self.lat_step = (self.north - self.south) / size or 1.0
+        self.lon_step = (self.east - self.west) / size or 1.0
+        self.grid = bytearray(size * size)
+        self._classify(0, 0, size)
+
     def __bool__(self):
         """Are boundaries a polygon?"""
         return True
 
     def __contains__(self, p):
-        return self.boundaries.contains(Point(p))
+        lat, lon = p
+        row = int((lat - self.south) / self.lat_step)
+        col = int((lon - self.west) / self.lon_step)
+        if not (0 <= row < self.size and 0 <= col < self.size):
+            return False
+        cell = self.grid[row * self.size + col]
+        if cell == self.EDGE:
+            return self.boundaries.contains(Point(p))
+        return cell == self.INSIDE
+
+    def contains_many(self, points):
+        return [p in self for p in points]
+
+    def _classify(self, row, col, span):
+        """Fill a square block of the grid, subdividing blocks on an edge"""
+        # pad the box so points on a block border are never misclassified
+        pad_lat = self.lat_step / 100
+        pad_lon = self.lon_step / 100
+        block = box(self.south + row * self.lat_step - pad_lat,
+                    self.west + col * self.lon_step - pad_lon,
+                    self.south + (row + span) * self.lat_step + pad_lat,
+                    self.west + (col + span) * self.lon_step + pad_lon)
+        if self.boundaries.contains(block):
+            value = self.INSIDE
+        elif not self.boundaries.intersects(block):
+            value = self.OUTSIDE
+        elif span > 1:
+            half = span // 2
+            for r, c in ((row, col), (row + half, col),
+                         (row, col + half), (row + half, col + half)):
+                self._classify(r, c, half)
+            return
+        else:
+            value = self.EDGE
+        for r in range(row, row + span):
+            start = r * self.size + col
+            self.grid[start:start + span] = bytes((value,)) * span
 
     def __hash__(self):
         return hash((self.south, self.west, self.north, self.east))
@@ -71,13 +120,52 @@ class RectBounds(Bounds):
         return (self.south <= lat <= self.north and
                 self.west <= lon <= self.east)
 
+    def contains_many(self, points):
+        south, north, west, east = self.south, self.north, self.west, self.east
+        return [south <= lat <= north and west <= lon <= east
+                for lat, lon in points]
+
     def __hash__(self):
         return hash((self.north, self.east, self.south, self.west))
 
 
+class ShardBounds(Bounds):
+    """One of count strips of other bounds, split by longitude"""
+    def __init__(self, bounds, index, count):
+        self.bounds = bounds
+        self.index = index
+        self.count = count
+        width = (bounds.east - bounds.west) / count
+        self.north = bounds.north
+        self.south = bounds.south
+        self.west = bounds.west + width * index
+        # the last strip includes its eastern edge
+        self.last = index == count - 1
+        self.east = bounds.east if self.last else self.west + width
+        self.center = ((self.north + self.south) / 2,
+                       (self.west + self.east) / 2)
+        self.multi = False
+
+    def __bool__(self):
+        return True
+
+    def __contains__(self, p):
+        lon = p[1]
+        return ((self.west <= lon < self.east or (self.last and lon == self.east))
+                and p in self.bounds)
+
+    def contains_many(self, points):
+        west, east, last = self.west, self.east, self.last
+        return [inside and (west <= lon < east or (last and lon == east))
+                for inside, (lat, lon) in zip(self.bounds.contains_many(points), points)]
+
+    def __hash__(self):
+        return hash((hash(self.bounds), self.index, self.count))
+
+
 if conf.BOUNDARIES:
     try:
-        from shapely.geometry import MultiPolygon, Point, Polygon
+        from shapely.geometry import MultiPolygon, Point, Polygon, box
         from shapely.prepared import prep
     except ImportError as e:
         raise ImportError('BOUNDARIES is set but shapely is not available.') from e
@@ -92,3 +180,6 @@ elif conf.STAY_WITHIN_MAP:
     sys.modules[__name__] = RectBounds()
 else:
     sys.modules[__name__] = Bounds()
+
+if shards.child:
+    sys.modules[__name__] = ShardBounds(sys.modules[__name__], shards.index, shards.count)
@@ -0,0 +1,107 @@
+from threading import Lock
+from time import time
+
+
+class Coordinator:
+    """Leases scan regions and the accounts used in them to scanner processes
+
+    Served by the manager of scan.py --shards, so processes on every host
+    connected to it share one set of leases and never scan the same spawns.
+    A process renews the lease on its region with each heartbeat, which also
+    reports its stats and, every few heartbeats, the latest state of the
+    accounts it holds. If the heartbeats stop, the region can be claimed
+    again and those accounts are queued for reuse.
+    """
+    def __init__(self, regions, extra_queue, accounts, lease=120):
+        self.regions = regions
+        self.extra_queue = extra_queue
+        # last known state of every account, used when a lease expires
+        self.accounts = accounts
+        # seconds a region is held without a heartbeat
+        self.lease = lease
+        # {region: (host, expires)}
+        self.claims = {}
+        # {region: {stat: value}} from the latest heartbeat
+        self.stats = {}
+        # {region: {username}} held by the region's workers
+        self.held = {}
+        # {username: account} handed back outside of the queues
+        self.saved = {}
+        self.expired = 0
+        self.lock = Lock()
+
+    def claim(self, host):
+        """Returns (region, regions) leased to host, None if all are taken"""
+        with self.lock:
+            self.expire()
+            for region in range(self.regions):
+                if region not in self.claims:
+                    self.claims[region] = host, time() + self.lease
+                    self.stats.pop(region, None)
+                    return region, self.regions
+        return None
+
+    def heartbeat(self, host, region, stats, accounts=None):
+        """Renews the lease, returns False if host no longer has region
+
+        accounts are those held by the region's workers, if they were sent.
+        """
+        with self.lock:
+            self.expire()
+            try:
+                if self.claims[region][0] != host:
+                    return False
+            except KeyError:
+                return False
+            self.claims[region] = host, time() + self.lease
+            self.stats[region] = stats
+            if accounts is not None:
+                self.held[region] = {account['username'] for account in accounts}
+                self.accounts.update((account['username'], account) for account in accounts)
+            return True
+
+    def release(self, host, region):
+        """End a lease, after its accounts were handed back"""
+        with self.lock:
+            try:
+                if self.claims[region][0] == host:
+                    del self.claims[region]
+                    self.held.pop(region, None)
+                    self.stats.pop(region, None)
+            except KeyError:
+                pass
+
+    def save(self, accounts):
+        """Keep accounts that shouldn't be queued, like banned ones"""
+        with self.lock:
+            for account in accounts:
+                self.accounts[account['username']] = account
+                self.saved[account['username']] = account
+
+    def get_saved(self):
+        with self.lock:
+            return dict(self.saved)
+
+    def expire(self):
+        now = time()
+        for region, (host, expires) in tuple(self.claims.items()):
+            if expires > now:
+                continue
+            del self.claims[region]
+            self.stats.pop(region, None)
+            self.expired += 1
+            for username in self.held.pop(region, ()):
+                account = self.accounts.get(username)
+                if account and not account.get('banned'):
+                    self.extra_queue.put(account)
+
+    def status(self):
+        """Returns {region: stats} of claimed regions and the expired count"""
+        with self.lock:
+            self.expire()
+            regions = {}
+            for region, (host, expires) in self.claims.items():
+                stats = dict(self.stats.get(region, {}))
+                stats['host'] = host
+                regions[region] = stats
+            return regions, self.regions, self.expired
@@ -2,9 +2,11 @@ from datetime import datetime
 from collections import OrderedDict
 from contextlib import contextmanager
 from enum import Enum
+from itertools import groupby
+from operator import itemgetter
 from time import time, mktime
 
-from sqlalchemy import Column, Integer, String, Float, Boolean, SmallInteger, BigInteger, ForeignKey, UniqueConstraint, create_engine, cast, func, desc, asc, and_, exists
+from sqlalchemy import Column, Integer, String, Float, Boolean, SmallInteger, BigInteger, ForeignKey, UniqueConstraint, create_engine, cast, func, desc, asc, and_, or_, exists
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.types import TypeDecorator, Numeric, Text
 from sqlalchemy.ext.declarative import declarative_base
@@ -211,12 +213,7 @@ class FortNameCache:
         return self.gyms.items()
     
     def get_name(self, fort_id):
-        #log.warning("fort_id {}", fort_id)
-        gym_name = ''
-        for key, name in self.items():
-            if key == fort_id:
-                gym_name = name
-        return gym_name
+        return self.gyms.get(fort_id, '')
 
     def pickle(self):
         state = self.__dict__.copy()
@@ -694,8 +691,12 @@ def add_fort_sighting(session, raw_fort):
     session.add(obj)
     FORT_CACHE.add(raw_fort)
 
-def add_fort_name(raw_fort):
+def add_fort_name(session, raw_fort):
     FORT_NAMES_CACHE.add(raw_fort)
+    # forts seen before their name was fetched were saved without one
+    session.query(Fort) \
+        .filter(Fort.external_id == raw_fort['external_id']) \
+        .update({'name': raw_fort['name']}, synchronize_session=False)
 
 def add_raid_sighting(session, raw_raid):
     # Check if fort exists
@@ -786,9 +787,9 @@ def update_failures(session, spawn_id, success, allowed=conf.FAILURES_ALLOWED):
         if success:
             spawnpoint.failures = 0
         elif spawnpoint.failures >= allowed:
-            if spawnpoint.duration == 60:
+            if spawnpoint.duration and spawnpoint.duration > 30:
+                log.warning('{} consecutive failures on {}, no longer treating as a {} minute spawn.', allowed + 1, spawn_id, spawnpoint.duration)
                 spawnpoint.duration = None
-                log.warning('{} consecutive failures on {}, no longer treating as an hour spawn.', allowed + 1, spawn_id)
             else:
                 spawnpoint.updated = 0
                 try:
@@ -926,6 +927,14 @@ def get_first_last(session, spawn_id):
         .first()
 
 
+def get_mystery_windows(session):
+    """Returns the earliest and latest second seen for each mystery spawn"""
+    query = session.query(Mystery.spawn_id, func.min(Mystery.first_seconds), func.max(Mystery.last_seconds)) \
+        .filter(Mystery.first_seen > conf.LAST_MIGRATION) \
+        .group_by(Mystery.spawn_id)
+    return {spawn_id: (first, last) for spawn_id, first, last in query}
+
+
 def get_widest_range(session, spawn_id):
     return session.query(func.max(Mystery.seen_range)) \
         .filter(Mystery.spawn_id == spawn_id) \
@@ -933,6 +942,88 @@ def get_widest_range(session, spawn_id):
         .scalar()
 
 
+def infer_despawn(intervals, durations=(1800, 2700, 3600), tolerance=180):
+    """Infer despawn second and duration from seen intervals of a spawn
+
+    intervals are (first_seconds, last_seconds) pairs, where last_seconds may
+    be past the end of the hour. The despawn time of every sighting must fall
+    between its last second and its first second plus the duration, so the
+    shortest duration that all intervals agree on is used. Returns the latest
+    possible despawn second and the duration in minutes, or None if the
+    possible despawn times span more than tolerance seconds.
+    """
+    for duration in durations:
+        lo = hi = None
+        for first, last in intervals:
+            start, end = last, first + duration
+            if start > end:
+                break
+            if lo is None:
+                lo, hi = start, end
+                continue
+            # align to the same hour as the intersection so far
+            shift = round((lo - start) / 3600) * 3600
+            lo = max(lo, start + shift)
+            hi = min(hi, end + shift)
+            if lo > hi:
+                break
+        else:
+            if lo is not None and hi - lo <= tolerance:
+                return hi % 3600, duration // 60
+            return None
+    return None
+
+
+def infer_spawn_times(session, tolerance=180, confirm=3):
+    """Infer despawn times of unknown spawns from their mystery sightings
+
+    The database picks the sightings of unknown spawns within bounds,
+    ordered by spawn, so they're inferred one spawn at a time and written
+    back in a single pass. Sightings can't rule out a longer spawn that was
+    only seen in its first half hour, so a 30 minute spawn must have been
+    seen at least confirm times, otherwise it is left unknown as ambiguous.
+    Returns the number of spawns that became known and that were ambiguous.
+    """
+    bound = bool(bounds)
+    query = session.query(Spawnpoint.id, Spawnpoint.lat, Spawnpoint.lon,
+                          Mystery.first_seconds, Mystery.last_seconds) \
+        .join(Mystery, Mystery.spawn_id == Spawnpoint.spawn_id) \
+        .filter(or_(Spawnpoint.updated.is_(None),
+                    Spawnpoint.updated <= conf.LAST_MIGRATION)) \
+        .filter(Mystery.first_seen > conf.LAST_MIGRATION) \
+        .filter(Mystery.first_seconds.isnot(None)) \
+        .filter(Mystery.last_seconds.isnot(None)) \
+        .order_by(Spawnpoint.id)
+    if bound or conf.STAY_WITHIN_MAP:
+        query = query.filter(Spawnpoint.lat >= bounds.south,
+                             Spawnpoint.lat <= bounds.north,
+                             Spawnpoint.lon >= bounds.west,
+                             Spawnpoint.lon <= bounds.east)
+
+    now = round(time())
+    updates = []
+    ambiguous = 0
+    for (spawnpoint_id, lat, lon), rows in groupby(query.yield_per(1000), key=itemgetter(0, 1, 2)):
+        if bound and (lat, lon) not in bounds:
+            continue
+        seen = [(first, last) for _, _, _, first, last in rows]
+        result = infer_despawn(seen, tolerance=tolerance)
+        if not result:
+            continue
+        despawn_time, duration = result
+        if duration == 30 and len(seen) < confirm:
+            ambiguous += 1
+            continue
+        updates.append({'id': spawnpoint_id,
+                        'despawn_time': despawn_time,
+                        'duration': None if duration == 30 else duration,
+                        'updated': now,
+                        'failures': 0})
+    if updates:
+        session.bulk_update_mappings(Spawnpoint, updates)
+    return len(updates), ambiguous
+
+
 def estimate_remaining_time(session, spawn_id, seen):
     first, last = get_first_last(session, spawn_id)
 
@@ -52,7 +52,7 @@ class DatabaseProcessor(Thread):
                 elif item_type == 'fort':
                     db.add_fort_sighting(session, item)
                 elif item_type == 'fort_name':
-                    db.add_fort_name(item)
+                    db.add_fort_name(session, item)
                 elif item_type == 'raid':
                     db.add_raid_sighting(session, item)
                 elif item_type == 'pokestop':
@@ -0,0 +1,137 @@
+import sys
+
+from collections import deque
+from time import time, monotonic
+
+from pogeo import get_distance
+
+from . import bounds
+
+
+class Freshness:
+    """Track when and where each S2 cell was last fetched by a GMO request
+
+    A spawn doesn't need a visit if a GetMapObjects request made after it
+    spawned was close enough to have seen it.
+    """
+    # characters for heatmap cells, youngest first
+    SHADES = (60, '#'), (300, '+'), (900, ':'), (3600, '.')
+
+    def __init__(self, radius=70):
+        # meters from a GMO request at which Pokémon are still visible
+        self.radius = radius
+        # {cell_id: deque([(time, (lat, lon))])}
+        self.cells = {}
+        self.saved = 0
+
+        ## For delta GMO requests
+        # {cell_id: current_timestamp_ms} of the last response
+        self.timestamps = {}
+        # {cell_id: {fort_id: fort}} merged from full and delta responses
+        self.forts = {}
+        # {'full' or 'delta': [requests, bytes, call seconds, parses, parse seconds]}
+        self.gmo_stats = {'full': [0, 0, 0.0, 0, 0.0], 'delta': [0, 0, 0.0, 0, 0.0]}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def record(self, cell_ids, point, now):
+        for cell_id in cell_ids:
+            try:
+                self.cells[cell_id].append((now, point))
+            except KeyError:
+                # keep a few, since a far away request may fetch the same cell
+                self.cells[cell_id] = deque(((now, point),), maxlen=4)
+
+    def covered(self, point, cell_ids, since):
+        """Was point within range of a GMO request made after since?"""
+        radius = self.radius
+        for cell_id in cell_ids:
+            try:
+                recent = self.cells[cell_id]
+            except KeyError:
+                continue
+            for fetched, gmo_point in recent:
+                if fetched > since and get_distance(point, gmo_point) <= radius:
+                    return True
+        return False
+
+    def since(self, cell_ids, max_age=3600000):
+        """Returns since_timestamp_ms for each cell, 0 to get all of its forts"""
+        oldest = time() * 1000 - max_age
+        timestamps = self.timestamps
+        return [timestamps.get(cell_id, 0) if timestamps.get(cell_id, 0) > oldest else 0
+                for cell_id in cell_ids]
+
+    def merge(self, map_cell, since):
+        """Returns all forts of map_cell, including those left out of a delta"""
+        cell_id = map_cell.s2_cell_id
+        forts = self.forts.get(cell_id, {}) if since else {}
+        for fort in map_cell.forts:
+            # copy so that the rest of the response can be freed
+            stored = type(fort)()
+            stored.CopyFrom(fort)
+            forts[fort.id] = stored
+        for object_id in map_cell.deleted_objects:
+            forts.pop(object_id, None)
+        self.forts[cell_id] = forts
+        self.timestamps[cell_id] = map_cell.current_timestamp_ms
+        return tuple(forts.values())
+
+    def measure(self, map_objects, delta, call_time, sample=50):
+        """Record the size and timing of a GMO response"""
+        stats = self.gmo_stats['delta' if delta else 'full']
+        stats[0] += 1
+        stats[1] += map_objects.ByteSize()
+        stats[2] += call_time
+        if stats[0] % sample == 1:
+            # time parsing a copy, since aiopogo parses it with the rest
+            data = map_objects.SerializeToString()
+            start = monotonic()
+            type(map_objects).FromString(data)
+            stats[3] += 1
+            stats[4] += monotonic() - start
+
+    def gmo_summary(self):
+        parts = []
+        for kind, (requests, size, call_time, parses, parse_time) in sorted(self.gmo_stats.items()):
+            if requests:
+                parts.append('{} {}: {:.1f} KB, call {:.0f} ms, parse {:.2f} ms'.format(
+                    requests, kind, size / requests / 1024, call_time / requests * 1000,
+                    parse_time / parses * 1000 if parses else 0))
+        return 'GMO responses: ' + ('; '.join(parts) or 'none yet')
+
+    def heatmap(self, rows=8, columns=40):
+        """Returns an ASCII map of how long ago each part of the area was scanned"""
+        now = time()
+        south, west = bounds.south, bounds.west
+        lat_step = (bounds.north - south) / rows or 1.0
+        lon_step = (bounds.east - west) / columns or 1.0
+        ages = [[None] * columns for _ in range(rows)]
+        for recent in tuple(self.cells.values()):
+            for fetched, (lat, lon) in recent:
+                row = int((lat - south) / lat_step)
+                column = int((lon - west) / lon_step)
+                if 0 <= row < rows and 0 <= column < columns:
+                    age = now - fetched
+                    current = ages[row][column]
+                    if current is None or age < current:
+                        ages[row][column] = age
+
+        lines = []
+        # north at the top
+        for row in reversed(ages):
+            line = []
+            for age in row:
+                shade = ' '
+                if age is not None:
+                    for limit, char in self.SHADES:
+                        if age < limit:
+                            shade = char
+                            break
+                line.append(shade)
+            lines.append('|' + ''.join(line) + '|')
+        return '\n'.join(lines)
+
+
+sys.modules[__name__] = Freshness()
@@ -0,0 +1,126 @@
+import sys
+
+from heapq import heappop, heappush
+from itertools import count
+from time import time, monotonic
+
+from aiopogo import HashServer
+
+from .shared import get_logger, LOOP
+
+
+class HashScheduler:
+    """Meter requests from all workers against the hashing quota
+
+    A token bucket refilled at the key's rate per second. Workers await a
+    token before each request; when tokens run short they are handed out by
+    priority, and the lowest priorities can't use the last few at all.
+    """
+    # lower numbers are served first
+    GMO_KNOWN, GMO, ENCOUNTER, SPIN, GYM, INCUBATE = range(6)
+
+    def __init__(self, burst=10, reserve=0.1):
+        # seconds worth of hashes that may be used at once
+        self.burst = burst
+        # fraction of the bucket kept for GMO requests and encounters
+        self.reserve = reserve
+        self.tokens = 0.0
+        self.updated = monotonic()
+        # don't refill before this (monotonic) time after exceeding the quota
+        self.resume = 0
+        # [(priority, sequence, future)]
+        self.waiters = []
+        self.sequence = count()
+        self.handle = None
+        self.granted = 0
+        self.log = get_logger('hash_scheduler')
+
+    def __str__(self):
+        return 'Hash scheduler: {:.0f} tokens, {} waiting, {} granted'.format(
+            self.tokens, len(self.waiters), self.granted)
+
+    @property
+    def rate(self):
+        """Hashes per second, or None if the quota is unknown"""
+        try:
+            return HashServer.status['maximum'] / 60
+        except (KeyError, TypeError):
+            return None
+
+    def held_back(self, priority, rate):
+        return self.reserve * rate * self.burst if priority > self.ENCOUNTER else 0
+
+    def refill(self, rate):
+        now = monotonic()
+        if now > self.resume:
+            elapsed = now - max(self.updated, self.resume)
+            self.tokens = min(self.tokens + elapsed * rate, rate * self.burst)
+        self.updated = now
+        # never hand out more than the server says are left this period
+        try:
+            if HashServer.status['period'] > time():
+                self.tokens = min(self.tokens, HashServer.status['remaining'])
+        except (KeyError, TypeError):
+            pass
+
+    async def acquire(self, priority):
+        rate = self.rate
+        if not rate:
+            # nothing to meter against until the first response
+            return
+        self.refill(rate)
+        if not self.waiters and self.tokens >= 1 + self.held_back(priority, rate):
+            self.tokens -= 1
+            self.granted += 1
+            return
+        future = LOOP.create_future()
+        heappush(self.waiters, (priority, next(self.sequence), future))
+        self.schedule(rate)
+        await future
+
+    def dispatch(self):
+        self.handle = None
+        rate = self.rate
+        if rate:
+            self.refill(rate)
+        waiters = self.waiters
+        while waiters:
+            priority, _, future = waiters[0]
+            if future.done():
+                # cancelled while waiting
+                heappop(waiters)
+                continue
+            if rate:
+                if self.tokens < 1 + self.held_back(priority, rate):
+                    break
+                self.tokens -= 1
+            heappop(waiters)
+            self.granted += 1
+            future.set_result(None)
+        self.schedule(rate)
+
+    def schedule(self, rate):
+        if self.handle or not self.waiters:
+            return
+        if rate:
+            needed = 1 + self.held_back(self.waiters[0][0], rate) - self.tokens
+            delay = max(needed / rate, self.resume - monotonic(), 0.05)
+        else:
+            delay = 1
+        self.handle = LOOP.call_later(delay, self.dispatch)
+
+    def exceeded(self):
+        """Stop handing out tokens until the quota period ends"""
+        self.tokens = 0
+        try:
+            wait = HashServer.status['period'] - time()
+        except (KeyError, TypeError):
+            wait = 0
+        self.resume = monotonic() + (wait + 1 if wait > 0 else 5)
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+        self.schedule(self.rate)
+
+
+sys.modules[__name__] = HashScheduler()
@@ -0,0 +1,405 @@
+from asyncio import Event, sleep, CancelledError
+from collections import Counter, OrderedDict, defaultdict
+from heapq import heappush
+from itertools import count
+from math import cos, floor, radians
+from time import time, monotonic
+
+from pogeo import get_distance
+
+from . import bounds, db_proc, sanitized as conf
+from .shared import get_logger, LOOP
+from .worker import Worker
+
+
+class EncounterQueue:
+    """Encounters published by scanning workers, done by idle nearby ones
+
+    A worker that finds a Pokémon worth encountering hands it over and
+    moves on to its next point. Jobs are assigned soonest deadline first
+    to the nearest idle worker that can reach the Pokémon within
+    SPEED_LIMIT. If none can before the deadline, the sighting is saved
+    without IVs.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        # [(deadline, sequence, pokemon, spawn_point_id, time_of_day)]
+        self.jobs = []
+        self.sequence = count()
+        # encounter IDs queued or being encountered
+        self.pending = set()
+        self.ready = Event(loop=LOOP)
+        self.running = True
+        self.done = 0
+        self.expired = 0
+        self.log = get_logger('encounters')
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __str__(self):
+        return 'Encounter queue: {} waiting, {} done, {} expired'.format(
+            len(self.jobs), self.done, self.expired)
+
+    def put(self, pokemon, spawn_point_id, time_of_day, wait=conf.ENCOUNTER_QUEUE):
+        """Queue pokemon, which will be saved once it's been encountered"""
+        encounter_id = pokemon['encounter_id']
+        if encounter_id in self.pending:
+            return
+        try:
+            wait = min(wait, pokemon['expire_timestamp'] - time() - 10)
+        except KeyError:
+            pass
+        self.pending.add(encounter_id)
+        heappush(self.jobs, (monotonic() + wait, next(self.sequence),
+                             pokemon, spawn_point_id, time_of_day))
+        self.ready.set()
+
+    def stop(self):
+        self.running = False
+        self.ready.set()
+
+    def nearest_idle(self, point, taken):
+        nearest = None
+        lowest_speed = conf.SPEED_LIMIT
+        for worker in self.workers:
+            if worker.busy.locked() or worker in taken or not worker.authenticated:
+                continue
+            speed = worker.travel_speed(point)
+            if speed < lowest_speed:
+                lowest_speed = speed
+                nearest = worker
+        return nearest
+
+    async def run(self):
+        while self.running:
+            if not self.jobs:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+
+            now = monotonic()
+            waiting = []
+            taken = set()
+            for job in sorted(self.jobs):
+                deadline, _, pokemon, spawn_point_id, time_of_day = job
+                if now > deadline:
+                    self.expired += 1
+                    self.finish(pokemon, time_of_day)
+                    continue
+                worker = self.nearest_idle((pokemon['lat'], pokemon['lon']), taken)
+                if worker:
+                    taken.add(worker)
+                    LOOP.create_task(self.encounter(
+                        worker, pokemon, spawn_point_id, time_of_day))
+                else:
+                    waiting.append(job)
+            # still sorted, so still a heap
+            self.jobs = waiting
+            if waiting:
+                await sleep(conf.SEARCH_SLEEP, loop=LOOP)
+
+    async def encounter(self, worker, pokemon, spawn_point_id, time_of_day):
+        try:
+            async with worker.busy:
+                error_code = worker.error_code
+                worker.speed = worker.travel_speed((pokemon['lat'], pokemon['lon']))
+                await worker.encounter(pokemon, spawn_point_id)
+                worker.error_code = error_code
+                self.done += 1
+        except CancelledError:
+            raise
+        except Exception as e:
+            self.log.warning('{} during encounter', e.__class__.__name__)
+        finally:
+            self.finish(pokemon, time_of_day)
+
+    def finish(self, pokemon, time_of_day):
+        self.pending.discard(pokemon['encounter_id'])
+        if conf.NOTIFY and Worker.notifier.eligible(pokemon):
+            LOOP.create_task(Worker.notifier.notify(pokemon, time_of_day))
+        db_proc.add(pokemon)
+
+
+class GymInfoQueue:
+    """Gyms without a name, fetched by idle workers when hashes allow
+
+    Visits only queue gyms here, so they never wait on GymGetInfo. Each
+    idle worker takes the nearest queued gym within reach of where it
+    already is, at most once per GYM_COOLDOWN.
+    """
+    def __init__(self, workers, reach=500):
+        self.workers = workers
+        # meters from a worker to a gym it can request info for
+        self.reach = reach
+        # {external_id: {'external_id': str, 'lat': float, 'lon': float}}
+        self.gyms = OrderedDict()
+        # the same gyms by grid cells at least reach wide, so only the cells
+        # around a worker need to be searched
+        self.lat_step = reach / 111320
+        self.lon_step = self.lat_step / cos(radians(bounds.center[0]))
+        self.cells = defaultdict(dict)
+        self.fetching = set()
+        self.ready = Event(loop=LOOP)
+        self.running = True
+        self.fetched = 0
+        self.log = get_logger('gym_info')
+
+    def __len__(self):
+        return len(self.gyms)
+
+    def __str__(self):
+        return 'Gym info queue: {} waiting, {} fetched'.format(
+            len(self.gyms), self.fetched)
+
+    def put(self, gym):
+        external_id = gym['external_id']
+        if external_id in self.gyms or external_id in self.fetching:
+            return
+        queued = {'external_id': external_id, 'lat': gym['lat'], 'lon': gym['lon']}
+        self.gyms[external_id] = queued
+        self.cells[self.cell(gym['lat'], gym['lon'])][external_id] = queued
+        self.ready.set()
+
+    def cell(self, lat, lon):
+        return floor(lat / self.lat_step), floor(lon / self.lon_step)
+
+    def remove(self, gym):
+        del self.gyms[gym['external_id']]
+        key = self.cell(gym['lat'], gym['lon'])
+        cell = self.cells[key]
+        del cell[gym['external_id']]
+        if not cell:
+            del self.cells[key]
+
+    def stop(self):
+        self.running = False
+        self.ready.set()
+
+    def available(self, now):
+        for worker in self.workers:
+            if (worker.busy.locked() or now < worker.next_gym
+                    or not worker.authenticated):
+                continue
+            if conf.SMART_THROTTLE and not worker.smart_throttle():
+                continue
+            yield worker
+
+    def nearest_pair(self):
+        """Returns the idle worker and queued gym closest to each other"""
+        nearest = None
+        shortest = self.reach
+        cells = self.cells
+        for worker in self.available(time()):
+            y, x = self.cell(*worker.location)
+            for key in ((y + i, x + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+                if key not in cells:
+                    continue
+                for gym in cells[key].values():
+                    distance = get_distance(worker.location, (gym['lat'], gym['lon']))
+                    if distance < shortest:
+                        shortest = distance
+                        nearest = worker, gym
+        return nearest
+
+    async def run(self):
+        while self.running:
+            if not self.gyms:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+            pair = self.nearest_pair()
+            if not pair:
+                await sleep(conf.SEARCH_SLEEP, loop=LOOP)
+                continue
+            worker, gym = pair
+            self.remove(gym)
+            self.fetching.add(gym['external_id'])
+            # so it isn't picked again before fetch takes its busy lock
+            worker.next_gym = time() + conf.GYM_COOLDOWN
+            LOOP.create_task(self.fetch(worker, gym))
+            # let fetches and everything else run between assignments
+            await sleep(0, loop=LOOP)
+
+    async def fetch(self, worker, gym):
+        try:
+            async with worker.busy:
+                error_code = worker.error_code
+                await worker.get_gym_name(gym)
+                worker.error_code = error_code
+            if gym.get('name'):
+                db_proc.add({'type': 'fort_name',
+                             'external_id': gym['external_id'],
+                             'name': gym['name']})
+                self.fetched += 1
+        except CancelledError:
+            raise
+        except Exception as e:
+            self.log.warning('{} while fetching gym info', e.__class__.__name__)
+        finally:
+            self.fetching.discard(gym['external_id'])
+
+
+class TokenRefresher:
+    """Renew auth tokens of idle workers before they expire
+
+    Otherwise a worker only logs in again once a request fails, and the
+    visit it was making is lost. The workers whose tokens expire soonest go
+    first, with no more refreshing at once than SIMULTANEOUS_LOGINS, so that
+    they don't hold up logins or keep many workers busy.
+    """
+    def __init__(self, workers, margin, interval=10):
+        self.workers = workers
+        # seconds before expiry at which a token may be refreshed
+        self.margin = margin
+        self.interval = interval
+        self.refreshing = set()
+        self.running = True
+        self.refreshed = 0
+        self.failed = 0
+        self.log = get_logger('token_refresher')
+
+    def __str__(self):
+        return 'Token refresher: {} refreshing, {} refreshed, {} failed'.format(
+            len(self.refreshing), self.refreshed, self.failed)
+
+    def stop(self):
+        self.running = False
+
+    def due(self, now):
+        """Returns (expiry, worker) of idle workers with expiring tokens"""
+        soon = now + self.margin
+        due = []
+        for worker in self.workers:
+            if (worker in self.refreshing or worker.busy.locked()
+                    or not worker.authenticated):
+                continue
+            try:
+                expiry = worker.api.auth_provider._access_token_expiry
+            except AttributeError:
+                continue
+            if expiry and expiry < soon:
+                due.append((expiry, worker.worker_no, worker))
+        due.sort()
+        return due
+
+    async def run(self):
+        while self.running:
+            room = conf.SIMULTANEOUS_LOGINS - len(self.refreshing)
+            if room > 0:
+                for _, _, worker in self.due(time())[:room]:
+                    self.refreshing.add(worker)
+                    LOOP.create_task(self.refresh(worker))
+            await sleep(self.interval, loop=LOOP)
+
+    async def refresh(self, worker):
+        try:
+            async with worker.busy:
+                if worker.retired or not worker.authenticated:
+                    # logged out or swapped while waiting, a visit will log in
+                    return
+                error_code = worker.error_code
+                if await worker.login(reauth=True):
+                    worker.error_code = error_code
+                    worker.update_accounts_dict()
+                    self.refreshed += 1
+                else:
+                    self.failed += 1
+                    await worker.swap_account(reason='token refresh failed')
+        except CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            self.log.warning('{} while refreshing a token', e.__class__.__name__)
+        finally:
+            self.refreshing.discard(worker)
+
+
+class Watchdog:
+    """Cancel worker operations that have been running for too long
+
+    A visit, login, encounter or CAPTCHA that hangs keeps the worker's busy
+    lock, and the worker is quietly skipped from then on. Any operation
+    running longer than budget seconds is cancelled, which frees the lock
+    and raises a StalledException in its caller, and the worker gets
+    another proxy. Its account is swapped if it was stuck logging in, or if
+    it got stuck again without finishing a visit in between, and benched if
+    it was stuck solving a CAPTCHA. Workers waiting for an account to swap
+    in are reported but not cancelled.
+    """
+    def __init__(self, workers, budget, interval=10, exempt=('swapping',)):
+        self.workers = workers
+        self.budget = budget
+        self.interval = interval
+        # operations that are waited out instead of cancelled
+        self.exempt = exempt
+        # operations over budget at the last check, by worker
+        self.stalled = {}
+        # operations cancelled, by name
+        self.stuck = Counter()
+        self.running = True
+        self.cancelled = 0
+        self.swapped = 0
+        self.log = get_logger('watchdog')
+
+    def __str__(self):
+        return 'Watchdog: {} stalled now, {} cancelled, {} swapped'.format(
+            len(self.stalled), self.cancelled, self.swapped)
+
+    def report(self):
+        """Returns a line on the operations workers got stuck in"""
+        stalled = Counter(self.stalled.values())
+        return 'Stalled in: {}; cancelled in: {}'.format(
+            ', '.join('{} {}'.format(n, op) for op, n in stalled.most_common()) or 'none',
+            ', '.join('{} {}'.format(n, op) for op, n in self.stuck.most_common()) or 'none')
+
+    def stop(self):
+        self.running = False
+
+    async def run(self):
+        while self.running:
+            self.check(monotonic())
+            await sleep(self.interval, loop=LOOP)
+
+    def check(self, now):
+        self.stalled.clear()
+        for worker in self.workers:
+            operation = worker.operation
+            if operation is None or now - worker.operation_start < self.budget:
+                continue
+            self.stalled[worker] = operation
+            if operation in self.exempt:
+                # the wait for an account doesn't count against what comes next
+                worker.operation_start = now
+                continue
+            task = worker.task
+            if task is None or task.done():
+                continue
+            self.log.warning('{} stuck in {} for {:.0f}s, cancelling.',
+                             worker.username, operation, now - worker.operation_start)
+            task.cancel()
+            # give the cancellation time to take effect
+            worker.operation_start = now
+            self.cancelled += 1
+            self.stuck[operation] += 1
+            worker.stalls += 1
+            if Worker.multiproxy:
+                worker.swap_proxy()
+            if operation in ('login', 'captcha') or worker.stalls > 1:
+                LOOP.create_task(self.swap(worker, operation))
+
+    async def swap(self, worker, operation):
+        try:
+            async with worker.busy:
+                if worker.retired:
+                    return
+                if operation == 'captcha':
+                    # still needs solving, so it goes back with the CAPTCHAs
+                    await worker.bench_account()
+                else:
+                    await worker.swap_account(reason='it was stuck in {}'.format(operation))
+            self.swapped += 1
+        except CancelledError:
+            raise
+        except Exception as e:
+            self.log.warning('{} while swapping a stuck worker', e.__class__.__name__)
@@ -1,20 +1,28 @@
-from asyncio import gather, Semaphore, sleep, Task, CancelledError
+from asyncio import gather, Event, Semaphore, sleep, Task, CancelledError, QueueFull
 from datetime import datetime
+from functools import partial
 from statistics import median
 from sys import platform
 from cyrandom import shuffle
-from collections import deque
-from itertools import dropwhile
+from collections import deque, Counter
+from heapq import heappop, heappush
+from itertools import chain, dropwhile
 from time import time, monotonic
+from queue import Empty
 
 from aiopogo import HashServer
+from pogeo import get_distance
 from sqlalchemy.exc import OperationalError
 
+from .account_pool import AccountPool
+from .adaptive import AdaptiveSemaphore
 from .db import SIGHTING_CACHE, MYSTERY_CACHE
-from .utils import get_current_hour, dump_pickle, get_start_coords, get_bootstrap_points, randomize_point, best_factors, percentage_split
-from .shared import get_logger, LOOP, run_threaded, ACCOUNTS
-from . import bounds, db_proc, spawns, sanitized as conf
-from .worker import Worker
+from .jobs import EncounterQueue, GymInfoQueue, TokenRefresher, Watchdog
+from .warm_pool import WarmPool
+from .utils import get_current_hour, dump_pickle, load_pickle, get_start_coords, get_bootstrap_points, randomize_point, best_factors, percentage_split, round_coords, sparse_points, weighted_kmeans
+from .shared import get_logger, LOOP, run_threaded, ACCOUNTS, EXECUTORS
+from . import bounds, db_proc, freshness, hash_scheduler, shards, spawns, sanitized as conf
+from .worker import Worker, UNIT
 
 ANSI = '\x1b[2J\x1b[H'
 if platform == 'win32':
@@ -64,39 +72,131 @@ class Overseer:
         self.coroutines_count = 0
         self.skipped = 0
         self.visits = 0
-        self.coroutine_semaphore = Semaphore(conf.COROUTINES_LIMIT, loop=LOOP)
+        if conf.ADAPTIVE_COROUTINES:
+            self.coroutine_semaphore = AdaptiveSemaphore(
+                conf.COROUTINES_LIMIT, *conf.ADAPTIVE_COROUTINES, loop=LOOP)
+            # durations of recent visits, consumed by tune_concurrency
+            self.visit_times = deque(maxlen=500)
+            self.last_visits = self.last_skipped = 0
+        else:
+            self.coroutine_semaphore = Semaphore(conf.COROUTINES_LIMIT, loop=LOOP)
         self.redundant = 0
+        # [(despawn_time, spawn_id, point, spawn_time)] heap of skipped spawns
+        self.catch_up = []
+        self.catch_up_ready = Event(loop=LOOP)
+        self.recovered = 0
+        self.expired = 0
+        # recently skipped points, where idle workers are moved on rebalance
+        self.hotspots = deque(maxlen=300)
         self.running = True
         self.all_seen = False
         self.idle_seconds = 0
+        self.print_handle = None
+        self.launch_task = None
         self.log.info('Overseer initialized')
         self.pokemon_found = ''
 
     def start(self, status_bar):
-        self.captcha_queue = self.manager.captcha_queue()
-        Worker.captcha_queue = self.manager.captcha_queue()
-        self.extra_queue = self.manager.extra_queue()
-        Worker.extra_queue = self.manager.extra_queue()
+        # only keep CAPTCHA accounts here if they can be solved here
+        self.captcha_queue = AccountPool(self.manager.captcha_queue(),
+                                         conf.ACCOUNT_POOL if conf.CAPTCHA_KEY else 0)
+        Worker.captcha_queue = self.captcha_queue
+        self.extra_queue = AccountPool(self.manager.extra_queue(), conf.ACCOUNT_POOL)
+        Worker.extra_queue = self.extra_queue
         if conf.MAP_WORKERS:
             Worker.worker_dict = self.manager.worker_dict()
 
-        for username, account in ACCOUNTS.items():
-            account['username'] = username
-            if account.get('banned'):
-                continue
-            if account.get('captcha'):
-                self.captcha_queue.put(account)
-            else:
-                self.extra_queue.put(account)
+        if shards.child:
+            # the coordinator queued the accounts, and leases the region
+            self.coordinator = self.manager.coordinator()
+            self.region_lost = False
+            self.heartbeating = False
+            self.next_accounts_sync = 0
+        else:
+            self.queue_accounts(self.captcha_queue, self.extra_queue)
+
+        LOOP.create_task(self.captcha_queue.run())
+        LOOP.create_task(self.extra_queue.run())
 
-        self.workers = tuple(Worker(worker_no=x) for x in range(conf.GRID[0] * conf.GRID[1]))
+        # a list, which is resized in place with ELASTIC_WORKERS
+        self.workers = [Worker(worker_no=x) for x in range(
+            shards.first_worker, shards.first_worker + shards.worker_count)]
+        self.next_worker_no = shards.extra_workers
+        if conf.WORKER_QUEUES:
+            for worker in self.workers:
+                LOOP.create_task(self.worker_loop(worker))
+        if conf.CATCH_UP:
+            LOOP.create_task(self.catch_up_loop())
+        if conf.ENCOUNTER_QUEUE:
+            self.encounters = EncounterQueue(self.workers)
+            Worker.encounter_queue = self.encounters
+            LOOP.create_task(self.encounters.run())
+        if conf.GYM_INFO_QUEUE:
+            self.gym_info = GymInfoQueue(self.workers)
+            Worker.gym_info_queue = self.gym_info
+            LOOP.create_task(self.gym_info.run())
+        if conf.TOKEN_REFRESH:
+            self.token_refresher = TokenRefresher(self.workers, conf.TOKEN_REFRESH)
+            LOOP.create_task(self.token_refresher.run())
+        if conf.WARM_POOL:
+            self.warm_pool = WarmPool(conf.WARM_POOL)
+            Worker.warm_pool = self.warm_pool
+            LOOP.create_task(self.warm_pool.run())
+        if conf.WATCHDOG:
+            self.watchdog = Watchdog(self.workers, conf.WATCHDOG)
+            LOOP.create_task(self.watchdog.run())
         db_proc.start()
+        if not shards.child:
+            # shards hand accounts back to the coordinator, which saves them
+            LOOP.call_later(60, self.save_accounts)
         LOOP.call_later(10, self.update_count)
         LOOP.call_later(max(conf.SWAP_OLDEST, conf.MINIMUM_RUNTIME), self.swap_oldest)
+        if conf.REBALANCE_INTERVAL:
+            LOOP.call_later(conf.REBALANCE_INTERVAL, self.rebalance)
+        if conf.ADAPTIVE_COROUTINES:
+            LOOP.call_later(10, self.tune_concurrency, monotonic() + 10)
+        if conf.ELASTIC_WORKERS:
+            self.elastic_skipped = self.elastic_visits = 0
+            self.elastic_reason = 'starting'
+            LOOP.call_later(60, self.resize)
         LOOP.call_soon(self.update_stats)
         if status_bar:
             LOOP.call_soon(self.print_status)
 
+    @staticmethod
+    def queue_accounts(captcha_queue, extra_queue):
+        for username, account in ACCOUNTS.items():
+            account['username'] = username
+            if account.get('banned'):
+                continue
+            if account.get('captcha'):
+                captcha_queue.put(account)
+            else:
+                extra_queue.put(account)
+
+    def stop(self):
+        self.running = False
+        self.catch_up_ready.set()
+        self.captcha_queue.stop()
+        self.extra_queue.stop()
+        if conf.ENCOUNTER_QUEUE:
+            self.encounters.stop()
+        if conf.GYM_INFO_QUEUE:
+            self.gym_info.stop()
+        if conf.TOKEN_REFRESH:
+            self.token_refresher.stop()
+        if conf.WARM_POOL:
+            self.warm_pool.stop()
+        if conf.WATCHDOG:
+            self.watchdog.stop()
+        if conf.WORKER_QUEUES:
+            # wake up worker loops that are waiting on an empty queue
+            for worker in self.workers:
+                try:
+                    worker.queue.put_nowait(None)
+                except QueueFull:
+                    pass
+
     def update_count(self):
         self.things_count.append(str(db_proc.count))
         self.pokemon_found = (
@@ -105,6 +205,24 @@ class Overseer:
             + '\n')
         LOOP.call_later(10, self.update_count)
 
+    def save_accounts(self, interval=60):
+        """Save accounts that changed, serialized here so none change meanwhile"""
+        if self.running:
+            rows = ACCOUNTS.snapshot()
+            if rows:
+                task = LOOP.create_task(run_threaded(ACCOUNTS.write, rows))
+                task.add_done_callback(partial(self.accounts_saved, rows))
+            LOOP.call_later(interval, self.save_accounts)
+
+    def accounts_saved(self, rows, task):
+        try:
+            task.result()
+        except Exception as e:
+            # rolled back, so save them with the next batch
+            ACCOUNTS.retry(rows)
+            self.log.error('{} while saving {} accounts, will retry.',
+                           e.__class__.__name__, len(rows))
+
     def swap_oldest(self, interval=conf.SWAP_OLDEST, minimum=conf.MINIMUM_RUNTIME):
         if not self.paused and not self.extra_queue.empty():
             oldest, minutes = self.longest_running()
@@ -112,6 +230,169 @@ class Overseer:
                 LOOP.create_task(oldest.lock_and_swap(minutes))
         LOOP.call_later(interval, self.swap_oldest)
 
+    async def density_centers(self):
+        """Cluster spawn points into one center per worker
+
+        Points are counted in ~100m cells first, so each cell is weighted by
+        its spawns per hour and k-means has far fewer points to go through.
+        """
+        cells = Counter(round_coords(p, 3) for p in chain(spawns.known, spawns.unknown))
+        points = list(cells)
+        return await run_threaded(weighted_kmeans, points, [cells[p] for p in points],
+                                  len(self.workers), executor='cpu')
+
+    def assign_homes(self, centers, weights, workers):
+        """Give the heaviest centers to the nearest remaining workers"""
+        workers = list(workers)
+        assigned = []
+        for _, center in sorted(zip(weights, centers), reverse=True):
+            if not workers:
+                break
+            worker = min(workers, key=lambda w: get_distance(w.location, center))
+            workers.remove(worker)
+            worker.home = center
+            assigned.append(worker)
+        return assigned
+
+    async def place_workers(self):
+        centers, weights = await self.density_centers()
+        for worker in self.assign_homes(centers, weights, self.workers):
+            # don't teleport accounts that were already somewhere
+            if 'location' not in worker.account:
+                worker.location = worker.home
+        self.log.info('Placed {} workers by spawn density.', len(centers))
+
+    def rebalance(self, interval=conf.REBALANCE_INTERVAL):
+        """Move idle workers' homes toward where spawns are being skipped"""
+        try:
+            now = time()
+            idle = [w for w in self.workers
+                    if not w.busy.locked() and now - w.last_gmo > interval]
+            if idle and self.hotspots and not self.paused:
+                points = list(self.hotspots)
+                self.hotspots.clear()
+                LOOP.create_task(self.move_idle(points, idle, interval))
+        except Exception:
+            self.log.exception('An exception occurred while rebalancing workers')
+        LOOP.call_later(interval, self.rebalance)
+
+    async def move_idle(self, points, idle, interval):
+        """Cluster points in the cpu executor and send idle workers to them"""
+        try:
+            centers, weights = await run_threaded(
+                weighted_kmeans, points, [1] * len(points), len(idle), executor='cpu')
+            # some may have been given work or retired while clustering
+            now = time()
+            idle = [w for w in idle if w in self.workers
+                    and not w.busy.locked() and now - w.last_gmo > interval]
+            moving = self.assign_homes(centers, weights, idle)
+            for worker in moving:
+                LOOP.create_task(self.move_home(worker))
+            self.log.info('Moving {} idle workers toward skipped spawns.', len(moving))
+        except CancelledError:
+            raise
+        except Exception:
+            self.log.exception('An exception occurred while rebalancing workers')
+
+    async def move_home(self, worker):
+        """Visit as far toward worker's home as SPEED_LIMIT allows"""
+        try:
+            async with worker.busy:
+                home = worker.home
+                speed = worker.travel_speed(home)
+                if speed > conf.SPEED_LIMIT:
+                    ratio = conf.SPEED_LIMIT / speed
+                    lat, lon = worker.location
+                    home = (lat + (home[0] - lat) * ratio,
+                            lon + (home[1] - lon) * ratio)
+                worker.speed = worker.travel_speed(home)
+                if await worker.visit(home):
+                    self.visits += 1
+        except CancelledError:
+            raise
+        except Exception:
+            self.log.exception('An exception occurred in move_home')
+
+    def resize(self, interval=60):
+        """Add workers while spawns are skipped, retire them while idle"""
+        try:
+            minimum, maximum = conf.ELASTIC_WORKERS
+            skipped = self.skipped - self.elastic_skipped
+            visits = self.visits - self.elastic_visits
+            self.elastic_skipped = self.skipped
+            self.elastic_visits = self.visits
+            skip_rate = skipped / (skipped + visits) if skipped else 0
+            backlog = len(self.catch_up)
+            if conf.WORKER_QUEUES:
+                backlog += sum(w.queue.qsize() for w in self.workers)
+
+            now = time()
+            idle = [w for w in self.workers
+                    if not w.busy.locked() and now - w.last_gmo > interval
+                    and not (conf.WORKER_QUEUES and w.queue.qsize())]
+            count = len(self.workers)
+            if self.paused:
+                pass
+            elif (skip_rate > 0.02 or backlog > count) and count < maximum:
+                added = self.add_workers(min(max(1, count // 10), maximum - count))
+                self.elastic_reason = 'added {}: {:.1%} skipped, {} backlog'.format(
+                    added, skip_rate, backlog)
+            elif not skipped and len(idle) > count // 4 and count > minimum:
+                # the longest running idle workers go first
+                idle.sort(key=lambda w: w.start_time or float('inf'))
+                retiring = idle[:min(max(1, count // 20), count - minimum)]
+                for worker in retiring:
+                    self.workers.remove(worker)
+                    if conf.WORKER_QUEUES:
+                        # its queue is empty, wake worker_loop so that it exits
+                        worker.queue.put_nowait(None)
+                    LOOP.create_task(worker.retire())
+                self.elastic_reason = 'retired {}: {} idle'.format(len(retiring), len(idle))
+        except Exception:
+            self.log.exception('An exception occurred while resizing the worker pool')
+        LOOP.call_later(interval, self.resize)
+
+    def add_workers(self, count):
+        """Start up to count new workers with accounts from the extra queue"""
+        added = 0
+        for _ in range(count):
+            try:
+                # not the CAPTCHA queue, like Worker would fall back to
+                account = self.extra_queue.get_nowait()
+            except Empty:
+                break
+            worker = Worker(worker_no=self.next_worker_no, account=account)
+            # the numbers in between belong to the other shards
+            self.next_worker_no += shards.count
+            self.workers.append(worker)
+            if conf.WORKER_QUEUES:
+                LOOP.create_task(self.worker_loop(worker))
+            added += 1
+        return added
+
+    def tune_concurrency(self, expected, interval=10):
+        """Feed the adaptive semaphore with what happened since last time"""
+        try:
+            lag = monotonic() - expected
+            latency = median(self.visit_times) if self.visit_times else None
+            self.visit_times.clear()
+
+            skipped = self.skipped - self.last_skipped
+            attempts = skipped + self.visits - self.last_visits
+            self.last_skipped = self.skipped
+            self.last_visits = self.visits
+
+            try:
+                headroom = HashServer.status['remaining'] / HashServer.status['maximum']
+            except (KeyError, TypeError, ZeroDivisionError):
+                headroom = None
+
+            self.coroutine_semaphore.adjust(
+                latency, skipped / attempts if attempts else 0, headroom, lag)
+        except Exception:
+            self.log.exception('An exception occurred while tuning concurrency')
+        LOOP.call_later(interval, self.tune_concurrency, monotonic() + interval)
+
     def print_status(self, refresh=conf.REFRESH_RATE):
         try:
             self._print_status()
@@ -139,46 +420,119 @@ class Overseer:
             except Exception as e:
                 self.log.exception('A wild {} appeared in exit_progress!', e.__class__.__name__)
 
-    def update_stats(self, refresh=conf.STAT_REFRESH, med=median, count=conf.GRID[0] * conf.GRID[1]):
-        visits = []
-        seen_per_worker = []
-        after_spawns = []
-        speeds = []
+    def update_stats(self, refresh=conf.STAT_REFRESH, med=median):
+        try:
+            visits = []
+            seen_per_worker = []
+            after_spawns = []
+            speeds = []
 
-        for w in self.workers:
-            after_spawns.append(w.after_spawn)
-            seen_per_worker.append(w.total_seen)
-            visits.append(w.visits)
-            speeds.append(w.speed)
-
-        self.stats = (
-            'Seen per worker: min {}, max {}, med {:.0f}\n'
-            'Visits per worker: min {}, max {}, med {:.0f}\n'
-            'Visit delay: min {:.1f}, max {:.1f}, med {:.1f}\n'
-            'Speed: min {:.1f}, max {:.1f}, med {:.1f}\n'
-            'Extra accounts: {}, CAPTCHAs needed: {}\n'
-        ).format(
-            min(seen_per_worker), max(seen_per_worker), med(seen_per_worker),
-            min(visits), max(visits), med(visits),
-            min(after_spawns), max(after_spawns), med(after_spawns),
-            min(speeds), max(speeds), med(speeds),
-            self.extra_queue.qsize(), self.captcha_queue.qsize()
-        )
-
-        self.sighting_cache_size = len(SIGHTING_CACHE.store)
-        self.mystery_cache_size = len(MYSTERY_CACHE.store)
-
-        self.update_coroutines_count()
-        self.counts = (
-            'Known spawns: {}, unknown: {}, more: {}\n'
-            '{} workers, {} coroutines\n'
-            'sightings cache: {}, mystery cache: {}, DB queue: {}\n'
-        ).format(
-            len(spawns), len(spawns.unknown), spawns.cells_count,
-            count, self.coroutines_count,
-            len(SIGHTING_CACHE), len(MYSTERY_CACHE), len(db_proc)
-        )
-        LOOP.call_later(refresh, self.update_stats)
+            for w in self.workers:
+                after_spawns.append(w.after_spawn)
+                seen_per_worker.append(w.total_seen)
+                visits.append(w.visits)
+                speeds.append(w.speed)
+
+            if self.workers:
+                self.stats = (
+                    'Seen per worker: min {}, max {}, med {:.0f}\n'
+                    'Visits per worker: min {}, max {}, med {:.0f}\n'
+                    'Visit delay: min {:.1f}, max {:.1f}, med {:.1f}\n'
+                    'Speed: min {:.1f}, max {:.1f}, med {:.1f}\n'
+                    'Extra accounts: {}, CAPTCHAs needed: {}\n'
+                ).format(
+                    min(seen_per_worker), max(seen_per_worker), med(seen_per_worker),
+                    min(visits), max(visits), med(visits),
+                    min(after_spawns), max(after_spawns), med(after_spawns),
+                    min(speeds), max(speeds), med(speeds),
+                    self.extra_queue.qsize(), self.captcha_queue.qsize()
+                )
+            else:
+                # e.g. every worker retired, or not enough accounts to start any
+                self.stats = 'No workers\nExtra accounts: {}, CAPTCHAs needed: {}\n'.format(
+                    self.extra_queue.qsize(), self.captcha_queue.qsize())
+
+            self.sighting_cache_size = len(SIGHTING_CACHE.store)
+            self.mystery_cache_size = len(MYSTERY_CACHE.store)
+
+            if conf.SKIP_FRESH:
+                self.heatmap = freshness.heatmap()
+
+            if conf.WORKER_QUEUES:
+                tasks = '{} points queued'.format(
+                    sum(w.queue.qsize() for w in self.workers))
+            else:
+                self.update_coroutines_count()
+                tasks = '{} coroutines'.format(self.coroutines_count)
+            self.counts = (
+                'Known spawns: {}, unknown: {}, more: {}\n'
+                '{} workers, {}\n'
+                'sightings cache: {}, mystery cache: {}, DB queue: {}\n'
+            ).format(
+                len(spawns), len(spawns.unknown), spawns.cells_count,
+                len(self.workers), tasks,
+                len(SIGHTING_CACHE), len(MYSTERY_CACHE), len(db_proc)
+            )
+            if shards.child:
+                LOOP.create_task(self.heartbeat({
+                    'workers': len(self.workers),
+                    'visits': self.visits,
+                    'skipped': self.skipped,
+                    'redundant': self.redundant,
+                    'seen': Worker.g['seen'],
+                    'captchas': Worker.g['captchas'],
+                    'known': len(spawns),
+                    'unknown': len(spawns.unknown),
+                    'db_queue': len(db_proc),
+                    'updated': time()
+                }))
+        except Exception:
+            self.log.exception('An exception occurred while updating stats')
+        finally:
+            # heartbeats stop with the stats, and the region with them
+            LOOP.call_later(refresh, self.update_stats)
+
+    async def heartbeat(self, stats, accounts_interval=conf.SHARD_LEASE / 4):
+        """Renew the lease on this shard's region, stop if it was lost
+
+        Every accounts_interval seconds the accounts held here are sent
+        along, so that the Coordinator can queue their latest state again if
+        the lease expires.
+        """
+        if self.heartbeating:
+            # the last one is still waiting for the manager
+            return
+        self.heartbeating = True
+        try:
+            if not self.region_lost:
+                now = time()
+                if now >= self.next_accounts_sync:
+                    self.next_accounts_sync = now + accounts_interval
+                    for worker in self.workers:
+                        worker.update_accounts_dict()
+                    # copied, so that they don't change while being sent
+                    accounts = [dict(w.account) for w in self.workers]
+                    accounts.extend(dict(a) for a in self.extra_queue.accounts)
+                    if conf.WARM_POOL:
+                        accounts.extend(dict(a) for a in self.warm_pool.accounts())
+                else:
+                    accounts = None
+                try:
+                    renewed = await run_threaded(self.coordinator.heartbeat, shards.host,
+                                                 shards.index, stats, accounts)
+                except (EOFError, OSError) as e:
+                    # without heartbeats the lease expires and the accounts are
+                    # queued again, so stop before another process uses them
+                    renewed = False
+                    self.log.error('{} while sending a heartbeat.', e.__class__.__name__)
+                if not renewed:
+                    # its accounts were queued again and another process may scan it
+                    self.region_lost = True
+                    self.log.error('Lease on region {} expired, stopping.', shards.index)
+            if self.region_lost and self.launch_task:
+                self.launch_task.cancel()
+        finally:
+            self.heartbeating = False
 
     def get_dots_and_messages(self):
         """Returns status dots and status messages for workers
@@ -248,6 +602,35 @@ class Overseer:
                 self.skipped, self.redundant)
         ]
 
+        if conf.CATCH_UP:
+            output.append('Catch-up: {} queued, {} recovered, {} expired'.format(
+                len(self.catch_up), self.recovered, self.expired))
+
+        if conf.ELASTIC_WORKERS:
+            output.append('Elastic workers: {}, between {} and {} ({})'.format(
+                len(self.workers), *conf.ELASTIC_WORKERS, self.elastic_reason))
+
+        if conf.ENCOUNTER_QUEUE:
+            output.append(str(self.encounters))
+        if conf.GYM_INFO_QUEUE:
+            output.append(str(self.gym_info))
+        if conf.TOKEN_REFRESH:
+            output.append(str(self.token_refresher))
+        if conf.WARM_POOL:
+            output.append(str(self.warm_pool))
+        if conf.WATCHDOG:
+            output.append(str(self.watchdog))
+            if self.watchdog.cancelled or self.watchdog.stalled:
+                output.append(self.watchdog.report())
+
+        if conf.DELTA_GMO:
+            output.append(freshness.gmo_summary())
+
+        if conf.SKIP_FRESH:
+            output.append('Fresh cells: {}, visits saved: {}\n'
+                          'Scan age (# <1m, + <5m, : <15m, . <1h):\n{}'.format(
+                len(freshness), freshness.saved, self.heatmap))
+
         try:
             seen = Worker.g['seen']
             captchas = Worker.g['captchas']
@@ -263,6 +646,15 @@ class Overseer:
         except ZeroDivisionError:
             pass
 
+        if conf.ADAPTIVE_COROUTINES:
+            output.append(str(self.coroutine_semaphore))
+
+        if conf.MAX_SCAN_DELAY and self.workers:
+            delays = [w.pacing.delay for w in self.workers]
+            output.append('Pacing: {} of {} accounts slowed, {:.1f}s between visits on average'.format(
+                sum(w.pacing.slowed for w in self.workers), len(delays),
+                sum(delays) / len(delays)))
+
         try:
             hash_status = HashServer.status
             output.append('Hashes: {}/{}, refresh in {:.0f}'.format(
@@ -273,6 +665,17 @@ class Overseer:
         except (KeyError, TypeError):
             pass
 
+        if conf.HASH_SCHEDULER:
+            output.append(str(hash_scheduler))
+
+        for executor in EXECUTORS.values():
+            if executor.completed or executor.pending:
+                output.append(str(executor))
+
+        if Worker.multiproxy:
+            output.append(str(Worker.proxies))
+            output.extend(Worker.proxies.report(limit=10))
+
         if _notify:
             sent = Worker.notifier.sent
             output.append('Notifications sent: {}, per hour {:.1f}'.format(
@@ -328,6 +731,8 @@ class Overseer:
     async def update_spawns(self, initial=False):
         while True:
             try:
+                if conf.INFER_SPAWNS:
+                    await run_threaded(spawns.infer)
                 await run_threaded(spawns.update)
                 LOOP.create_task(run_threaded(spawns.pickle))
             except OperationalError as e:
@@ -344,18 +749,25 @@ class Overseer:
                 break
 
     async def launch(self, bootstrap, pickle):
+        self.launch_task = Task.current_task(loop=LOOP)
         exceptions = 0
         self.next_mystery_reload = 0
 
         if not pickle or not spawns.unpickle():
             await self.update_spawns(initial=True)
 
-        if not spawns or bootstrap:
+        state = self.load_bootstrap()
+        if not spawns or bootstrap or (state and state['phase']):
             try:
-                await self.bootstrap()
+                await self.bootstrap(state if state and state['phase'] else None)
                 await self.update_spawns()
             except CancelledError:
                 return
+        elif state:
+            self.resume_revisits(state)
+
+        if conf.DENSITY_PLACEMENT:
+            await self.place_workers()
 
         update_spawns = False
         self.mysteries = spawns.mystery_gen()
@@ -377,7 +789,6 @@ class Overseer:
     async def _launch(self, update_spawns):
         if update_spawns:
             await self.update_spawns()
-            LOOP.create_task(run_threaded(dump_pickle, 'accounts', ACCOUNTS))
             spawns_iter = iter(spawns.items())
         else:
             start_point = self.get_start_point()
@@ -393,9 +804,12 @@ class Overseer:
 
         captcha_limit = conf.MAX_CAPTCHAS
         skip_spawn = conf.SKIP_SPAWN
+        skip_fresh = conf.SKIP_FRESH
         for point, (spawn_id, spawn_seconds) in spawns_iter:
             try:
-                if self.captcha_queue.qsize() > captcha_limit:
+                # qsize is as of the last sync, so check before pausing
+                if (self.captcha_queue.qsize() > captcha_limit
+                        and await self.captcha_queue.count() > captcha_limit):
                     self.paused = True
                     self.idle_seconds += await run_threaded(self.captcha_queue.full_wait, conf.MAX_CAPTCHAS)
                     self.paused = False
@@ -412,8 +826,7 @@ class Overseer:
                 try:
                     mystery_point = next(self.mysteries)
 
-                    await self.coroutine_semaphore.acquire()
-                    LOOP.create_task(self.try_point(mystery_point))
+                    await self.launch_point(mystery_point)
                 except StopIteration:
                     if self.next_mystery_reload < monotonic():
                         self.mysteries = spawns.mystery_gen()
@@ -425,10 +838,21 @@ class Overseer:
             if time_diff > 5 and spawn_id in SIGHTING_CACHE.store:
                 self.redundant += 1
                 continue
+            elif skip_fresh and freshness.covered(
+                    point, Worker.get_cell_ids(point), spawn_time + 10):
+                # scanned within range since it spawned, by another visit
+                freshness.saved += 1
+                continue
             elif time_diff > skip_spawn:
-                self.skipped += 1
+                self.skip(point, spawn_time, spawn_id)
                 continue
 
+            await self.launch_point(point, spawn_time, spawn_id)
+
+    async def launch_point(self, point, spawn_time=None, spawn_id=None):
+        if conf.WORKER_QUEUES:
+            await self.dispatch(point, spawn_time, spawn_id)
+        else:
             await self.coroutine_semaphore.acquire()
             LOOP.create_task(self.try_point(point, spawn_time, spawn_id))
 
@@ -439,66 +863,191 @@ class Overseer:
                 if await worker.visit(point):
                     self.visits += 1
 
-    async def bootstrap(self):
+    def load_bootstrap(self):
+        """Returns the checkpoint of an unfinished bootstrap of these bounds"""
+        state = load_pickle('bootstrap')
         try:
-            self.log.warning('Starting bootstrap phase 1.')
-            await self.bootstrap_one()
-        except CancelledError:
-            raise
-        except Exception:
-            self.log.exception('An exception occurred during bootstrap phase 1.')
+            if state['bounds_hash'] == hash(bounds) and (state['phase'] or state['revisits']):
+                return state
+        except (KeyError, TypeError):
+            pass
+        return None
+
+    def checkpoint(self):
+        state = self.bootstrap_state
+        # copy on the loop, since the thread would see it change
+        state = {'bounds_hash': state['bounds_hash'],
+                 'phase': state['phase'],
+                 'results': state['results'].copy(),
+                 'remaining': None if state['remaining'] is None else state['remaining'].copy(),
+                 'revisits': state['revisits'].copy()}
+        return run_threaded(dump_pickle, 'bootstrap', state)
+
+    async def checkpoint_loop(self, interval=60):
+        state = self.bootstrap_state
+        while self.running and (state['phase'] or state['revisits']):
+            await sleep(interval, loop=LOOP)
+            await self.checkpoint()
+        await self.checkpoint()
 
+    def schedule_revisit(self, point, due):
+        self.bootstrap_state['revisits'][point] = due
+        LOOP.call_later(max(due - time(), 0), LOOP.create_task, self.revisit(point))
+
+    async def revisit(self, point):
         try:
-            self.log.warning('Starting bootstrap phase 2.')
-            await self.bootstrap_two()
-        except CancelledError:
-            raise
-        except Exception:
-            self.log.exception('An exception occurred during bootstrap phase 2.')
+            await self.try_again(point)
+        finally:
+            self.bootstrap_state['revisits'].pop(point, None)
+
+    def resume_revisits(self, state):
+        """Schedule second visits left over from a bootstrap that finished"""
+        self.bootstrap_state = state
+        for point, due in tuple(state['revisits'].items()):
+            self.schedule_revisit(point, due)
+        LOOP.create_task(self.checkpoint_loop())
+
+    async def bootstrap(self, state=None):
+        """Discover spawns in three phases, resuming from state if given
+
+        Progress is checkpointed to the bootstrap pickle every minute, so a
+        restart continues where it left off.
+        """
+        if state:
+            self.log.warning('Resuming bootstrap at phase {}.', state['phase'])
+        else:
+            state = {'bounds_hash': hash(bounds),
+                     'phase': 1,
+                     # {(lat, lon): things seen} by phase 1
+                     'results': {},
+                     # points of the current phase that haven't been visited
+                     'remaining': None,
+                     # {(lat, lon): due time} of second visits from phase 2
+                     'revisits': {}}
+        self.bootstrap_state = state
+        for point, due in tuple(state['revisits'].items()):
+            self.schedule_revisit(point, due)
+        LOOP.create_task(self.checkpoint_loop())
+
+        if state['phase'] == 1:
+            try:
+                self.log.warning('Starting bootstrap phase 1.')
+                await self.bootstrap_one()
+            except CancelledError:
+                raise
+            except Exception:
+                self.log.exception('An exception occurred during bootstrap phase 1.')
+            state['phase'] = 2
+            state['remaining'] = None
+            await self.checkpoint()
+
+        if state['phase'] == 2:
+            try:
+                self.log.warning('Starting bootstrap phase 2.')
+                await self.bootstrap_two()
+            except CancelledError:
+                raise
+            except Exception:
+                self.log.exception('An exception occurred during bootstrap phase 2.')
+            state['phase'] = 3
+            state['remaining'] = None
+            await self.checkpoint()
 
         self.log.warning('Starting bootstrap phase 3.')
-        unknowns = list(spawns.unknown)
+        if state['remaining'] is None:
+            state['remaining'] = set(spawns.unknown)
+        unknowns = list(state['remaining'])
         shuffle(unknowns)
-        tasks = (self.try_again(point) for point in unknowns)
+        tasks = (self.bootstrap_three(point) for point in unknowns)
         await gather(*tasks, loop=LOOP)
+        state['phase'] = 0
+        state['remaining'] = None
+        await self.checkpoint()
         self.log.warning('Finished bootstrapping.')
 
     async def bootstrap_one(self):
-        async def visit_release(worker, num, *args):
+        async def visit_release(point, worker=None):
             async with self.coroutine_semaphore:
+                if worker is None:
+                    worker = await self.best_worker(point, False)
+                    if worker is None:
+                        return
                 async with worker.busy:
-                    point = get_start_coords(num, *args)
                     self.log.warning('start_coords: {}', point)
-                    self.visits += await worker.bootstrap_visit(point)
+                    seen = await worker.bootstrap_visit(point)
+                    self.bootstrap_state['results'][point] = seen
+                    if seen:
+                        self.visits += 1
+                remaining.discard(point)
+
+        state = self.bootstrap_state
+        if state['remaining'] is None:
+            pairs = self.start_points()
+            state['remaining'] = {point for _, point in pairs}
+            tasks = [visit_release(point, worker) for worker, point in pairs]
+        else:
+            # resumed, visit what's left with whichever workers are nearest
+            tasks = [visit_release(point) for point in state['remaining']]
+        remaining = state['remaining']
+        await gather(*tasks, loop=LOOP)
 
+    def start_points(self):
+        """Returns a (worker, point) pair for each worker's phase 1 visit"""
         if bounds.multi:
             areas = [poly.polygon.area for poly in bounds.polygons]
             area_sum = sum(areas)
             percentages = [area / area_sum for area in areas]
-            tasks = []
+            pairs = []
             for i, workers in enumerate(percentage_split(
                     self.workers, percentages)):
                 grid = best_factors(len(workers))
-                tasks.extend(visit_release(w, n, grid, bounds.polygons[i])
+                pairs.extend((w, get_start_coords(n, grid, bounds.polygons[i]))
                              for n, w in enumerate(workers))
+            return pairs
+        # fewer workers than GRID when sharded or elastic
+        if len(self.workers) == conf.GRID[0] * conf.GRID[1]:
+            grid = conf.GRID
         else:
-            tasks = (visit_release(w, n) for n, w in enumerate(self.workers))
-        await gather(*tasks, loop=LOOP)
+            grid = best_factors(len(self.workers))
+        return [(w, get_start_coords(n, grid)) for n, w in enumerate(self.workers)]
+
+    async def sparse_points(self, points, keep=conf.BOOTSTRAP_SPARSE):
+        """Keep only 1 in every keep points nearest to an empty phase 1 visit"""
+        results = self.bootstrap_state['results']
+        if keep <= 1 or not results or all(results.values()):
+            return points
+        sampled = await run_threaded(sparse_points, points, dict(results), keep,
+                                     executor='cpu')
+        self.log.warning('Sampling {} of {} bootstrap points, skipping empty areas.',
+                         len(sampled), len(points))
+        return sampled
 
     async def bootstrap_two(self):
         async def bootstrap_try(point):
             async with self.coroutine_semaphore:
                 randomized = randomize_point(point, randomization)
-                LOOP.call_later(1790, LOOP.create_task, self.try_again(randomized))
+                self.schedule_revisit(randomized, time() + 1790)
                 worker = await self.best_worker(point, False)
                 async with worker.busy:
-                    self.visits += await worker.bootstrap_visit(point)
+                    if await worker.bootstrap_visit(point):
+                        self.visits += 1
+                remaining.discard(point)
 
+        state = self.bootstrap_state
+        if state['remaining'] is None:
+            state['remaining'] = set(await self.sparse_points(get_bootstrap_points(bounds)))
+        remaining = state['remaining']
         # randomize to within ~140m of the nearest neighbor on the second visit
         randomization = conf.BOOTSTRAP_RADIUS / 155555 - 0.00045
-        tasks = (bootstrap_try(x) for x in get_bootstrap_points(bounds))
+        points = list(remaining)
+        shuffle(points)
+        tasks = (bootstrap_try(x) for x in points)
         await gather(*tasks, loop=LOOP)
 
+    async def bootstrap_three(self, point):
+        await self.try_again(point)
+        self.bootstrap_state['remaining'].discard(point)
+
     async def try_point(self, point, spawn_time=None, spawn_id=None):
         try:
             point = randomize_point(point)
@@ -506,14 +1055,17 @@ class Overseer:
             worker = await self.best_worker(point, skip_time)
             if not worker:
                 if spawn_time:
-                    self.skipped += 1
+                    self.skip(point, spawn_time, spawn_id)
                 return
             async with worker.busy:
                 if spawn_time:
                     worker.after_spawn = time() - spawn_time
 
+                start = monotonic()
                 if await worker.visit(point, spawn_id):
                     self.visits += 1
+                if conf.ADAPTIVE_COROUTINES:
+                    self.visit_times.append(monotonic() - start)
         except CancelledError:
             raise
         except Exception:
@@ -521,6 +1073,131 @@ class Overseer:
         finally:
             self.coroutine_semaphore.release()
 
+    def skip(self, point, spawn_time, spawn_id, margin=conf.CATCH_UP):
+        """Count a skipped spawn and queue it for catch-up if it will last"""
+        self.skipped += 1
+        if conf.REBALANCE_INTERVAL:
+            self.hotspots.append(point)
+        if not margin:
+            return
+        # a second after the spawn so that hour-long spawns despawn next hour
+        despawn_time = spawns.get_despawn_time(spawn_id, spawn_time + 1)
+        if despawn_time and despawn_time - time() > margin:
+            heappush(self.catch_up, (despawn_time, spawn_id, point, spawn_time))
+            self.catch_up_ready.set()
+
+    async def catch_up_loop(self, margin=conf.CATCH_UP):
+        """Retry skipped spawns, earliest despawn time first"""
+        while self.running:
+            if not self.catch_up:
+                self.catch_up_ready.clear()
+                await self.catch_up_ready.wait()
+                continue
+            try:
+                await self.coroutine_semaphore.acquire()
+                despawn_time, spawn_id, point, spawn_time = heappop(self.catch_up)
+            except IndexError:
+                self.coroutine_semaphore.release()
+                continue
+            if spawn_id in SIGHTING_CACHE.store:
+                self.redundant += 1
+                self.coroutine_semaphore.release()
+            elif despawn_time - time() < margin:
+                self.expired += 1
+                self.coroutine_semaphore.release()
+            else:
+                LOOP.create_task(self.try_catch_up(point, spawn_time, spawn_id, despawn_time))
+
+    async def try_catch_up(self, point, spawn_time, spawn_id, despawn_time):
+        try:
+            point = randomize_point(point)
+            skip_time = monotonic() + despawn_time - time() - conf.CATCH_UP
+            worker = await self.best_worker(point, skip_time)
+            if not worker:
+                self.expired += 1
+                return
+            async with worker.busy:
+                worker.after_spawn = time() - spawn_time
+
+                if await worker.visit(point, spawn_id):
+                    self.visits += 1
+                    self.recovered += 1
+        except CancelledError:
+            raise
+        except Exception:
+            self.log.exception('An exception occurred in try_catch_up')
+        finally:
+            self.coroutine_semaphore.release()
+
+    async def dispatch(self, point, spawn_time=None, spawn_id=None):
+        """Add point to the queue of the worker that could reach it soonest"""
+        point = randomize_point(point)
+        skip_time = monotonic() + (conf.GIVE_UP_KNOWN if spawn_time else conf.GIVE_UP_UNKNOWN)
+        while self.running:
+            worker = self.nearest_queue(point)
+            if worker:
+                worker.queue.put_nowait((point, spawn_time, spawn_id, skip_time))
+                worker.queue_tail = point
+                return
+            if monotonic() > skip_time:
+                if spawn_time:
+                    self.skip(point, spawn_time, spawn_id)
+                return
+            await sleep(conf.SEARCH_SLEEP, loop=LOOP)
+
+    def nearest_queue(self, point, unit=UNIT):
+        """Returns the worker with queue space that could reach point soonest
+
+        The estimate is whichever is longer: the time needed to work through
+        the points already assigned, or the time needed to travel from the last
+        assigned point at SPEED_LIMIT.
+        """
+        speed_limit = conf.SPEED_LIMIT / 3600
+        soonest = float('inf')
+        nearest = None
+        for w in self.workers:
+            queue = w.queue
+            if queue.full():
+                continue
+            waiting = (queue.qsize() + w.busy.locked()) * w.pacing.delay
+            travel = get_distance(w.queue_tail, point, unit) / speed_limit
+            eta = waiting if waiting > travel else travel
+            if eta < soonest:
+                soonest = eta
+                nearest = w
+        return nearest
+
+    async def worker_loop(self, worker):
+        """Visit the points assigned to worker's queue, one at a time"""
+        queue = worker.queue
+        while self.running and worker in self.workers:
+            item = await queue.get()
+            if item is None:
+                continue
+            point, spawn_time, spawn_id, skip_time = item
+            try:
+                while worker.travel_speed(point) > conf.SPEED_LIMIT:
+                    if monotonic() > skip_time:
+                        if spawn_time:
+                            self.skip(point, spawn_time, spawn_id)
+                        break
+                    await sleep(conf.SEARCH_SLEEP, loop=LOOP)
+                else:
+                    async with worker.busy:
+                        worker.speed = worker.travel_speed(point)
+                        if spawn_time:
+                            worker.after_spawn = time() - spawn_time
+
+                        if await worker.visit(point, spawn_id):
+                            self.visits += 1
+            except CancelledError:
+                raise
+            except Exception:
+                self.log.exception('An exception occurred in worker_loop')
+            finally:
+                if queue.empty():
+                    worker.queue_tail = worker.location
+
     async def best_worker(self, point, skip_time):
         good_enough = conf.GOOD_ENOUGH
         while self.running:
@@ -545,7 +1222,6 @@ class Overseer:
             await sleep(conf.SEARCH_SLEEP, loop=LOOP)
 
     def refresh_dict(self):
-        while not self.extra_queue.empty():
-            account = self.extra_queue.get()
+        for account in self.extra_queue.drain():
             username = account['username']
             ACCOUNTS[username] = account
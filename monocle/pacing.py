@@ -0,0 +1,59 @@
+from cyrandom import uniform
+
+
+class Pacing:
+    """How hard an account can be pushed, learned from its recent outcomes
+
+    The time between GetMapObjects requests grows by half with each
+    failure, like an empty or malformed response or a timeout, and shrinks
+    back towards the minimum by a tenth of it with each success. Sleeps
+    after errors are scaled by the recent error rate and doubled for each
+    failure in a row, so a healthy account shrugs off the odd error and a
+    flaky one stops burning visits. The state is saved with the account.
+    """
+    __slots__ = ('minimum', 'maximum', 'delay', 'errors', 'strikes', 'alpha')
+
+    def __init__(self, minimum, maximum, state=None, alpha=0.2):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        # seconds to wait between GetMapObjects requests
+        self.delay = minimum
+        # moving average of failures per request
+        self.errors = 0.0
+        # failures in a row
+        self.strikes = 0
+        # weight of the latest outcome in the moving average
+        self.alpha = alpha
+        if state:
+            delay, self.errors, self.strikes = state
+            self.delay = min(max(delay, self.minimum), self.maximum)
+
+    def __str__(self):
+        return '{:.1f}s, {:.0%} errors'.format(self.delay, self.errors)
+
+    @property
+    def state(self):
+        return self.delay, self.errors, self.strikes
+
+    @property
+    def slowed(self):
+        return self.delay > self.minimum
+
+    def success(self):
+        self.errors -= self.alpha * self.errors
+        self.strikes = 0
+        if self.delay > self.minimum:
+            self.delay = max(self.delay - self.minimum / 10, self.minimum)
+
+    def failure(self):
+        self.errors += self.alpha * (1 - self.errors)
+        self.strikes += 1
+        self.delay = min(self.delay * 1.5, self.maximum)
+
+    def backoff(self, minimum, maximum):
+        """Returns seconds to sleep after an error, scaled from the range given"""
+        if self.maximum == self.minimum:
+            # not adapting
+            return uniform(minimum, maximum)
+        factor = (0.5 + self.errors) * 2 ** min(max(self.strikes - 1, 0), 3)
+        return uniform(minimum, maximum) * factor
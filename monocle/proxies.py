@@ -0,0 +1,138 @@
+from time import monotonic
+
+from cyrandom import uniform
+
+
+class ProxyStats:
+    __slots__ = ('latency', 'errors', 'requests', 'failures', 'bans', 'load',
+                 'strikes', 'until')
+
+    def __init__(self, latency):
+        # moving averages of seconds per request and of failures per request
+        self.latency = latency
+        self.errors = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.bans = 0
+        # requests in progress
+        self.load = 0
+        # failures in a row, each doubles the quarantine
+        self.strikes = 0
+        # quarantined until this (monotonic) time
+        self.until = 0
+
+
+class ProxyPool:
+    """Proxies handed out by how well they've been working
+
+    Each proxy is scored by its average latency, error rate and the number
+    of requests in progress through it, and picked at random weighted by
+    score. A proxy that fails several times in a row, or gets IP banned, is
+    quarantined for a time that doubles with each further failure.
+    """
+    def __init__(self, proxies, failures=(), bans=(), alpha=0.2,
+                 strikes=3, backoff=30, max_backoff=3600, latency=1.0):
+        self.stats = {proxy: ProxyStats(latency) for proxy in proxies}
+        # exceptions that count against a proxy, and that mean it's banned
+        self.failure_types = failures
+        self.ban_types = bans
+        # weight of the latest request in the moving averages
+        self.alpha = alpha
+        # failures in a row before quarantine
+        self.strikes = strikes
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def __len__(self):
+        return len(self.stats)
+
+    def __str__(self):
+        now = monotonic()
+        quarantined = sum(s.until > now for s in self.stats.values())
+        return 'Proxies: {} available, {} quarantined'.format(
+            len(self.stats) - quarantined, quarantined)
+
+    def score(self, stats):
+        return (1 - stats.errors) / (stats.latency * (1 + stats.load))
+
+    def get(self, exclude=None):
+        """Returns a proxy picked at random, weighted by score"""
+        now = monotonic()
+        candidates = [(proxy, self.score(stats)) for proxy, stats in self.stats.items()
+                      if stats.until <= now and proxy != exclude]
+        if not candidates:
+            # all quarantined, use the one that will be back soonest
+            others = [p for p in self.stats if p != exclude] or list(self.stats)
+            return min(others, key=lambda p: self.stats[p].until)
+        total = sum(score for _, score in candidates)
+        target = uniform(0, total)
+        for proxy, score in candidates:
+            target -= score
+            if target <= 0:
+                return proxy
+        return candidates[-1][0]
+
+    def quarantined(self, proxy):
+        return self.stats[proxy].until > monotonic()
+
+    def track(self, proxy):
+        """Context manager to record a request made through proxy"""
+        return ProxyRequest(self, proxy)
+
+    def success(self, proxy, latency):
+        stats = self.stats[proxy]
+        stats.requests += 1
+        stats.latency += self.alpha * (latency - stats.latency)
+        stats.errors -= self.alpha * stats.errors
+        stats.strikes = 0
+
+    def failure(self, proxy, banned=False):
+        stats = self.stats[proxy]
+        stats.requests += 1
+        stats.failures += 1
+        stats.errors += self.alpha * (1 - stats.errors)
+        stats.strikes += 1
+        if banned:
+            stats.bans += 1
+            # straight to quarantine
+            stats.strikes = max(stats.strikes, self.strikes)
+        if stats.strikes >= self.strikes:
+            backoff = min(self.backoff * 2 ** (stats.strikes - self.strikes),
+                          self.max_backoff)
+            stats.until = monotonic() + backoff
+
+    def report(self, limit=None):
+        """Returns a line of stats for each proxy, best first"""
+        now = monotonic()
+        ranked = sorted(self.stats.items(), key=lambda x: self.score(x[1]), reverse=True)
+        lines = []
+        for proxy, stats in ranked[:limit]:
+            line = '{}: {:.0f} ms, {:.0%} errors, {} requests, {} bans, {} active'.format(
+                proxy, stats.latency * 1000, stats.errors, stats.requests,
+                stats.bans, stats.load)
+            if stats.until > now:
+                line += ', quarantined for {:.0f}s'.format(stats.until - now)
+            lines.append(line)
+        return lines
+
+
+class ProxyRequest:
+    __slots__ = ('pool', 'proxy', 'start')
+
+    def __init__(self, pool, proxy):
+        self.pool = pool
+        self.proxy = proxy
+
+    def __enter__(self):
+        self.pool.stats[self.proxy].load += 1
+        self.start = monotonic()
+
+    def __exit__(self, exc_type, exc, tb):
+        pool = self.pool
+        pool.stats[self.proxy].load -= 1
+        if exc_type is None:
+            pool.success(self.proxy, monotonic() - self.start)
+        elif issubclass(exc_type, pool.ban_types):
+            pool.failure(self.proxy, banned=True)
+        elif issubclass(exc_type, pool.failure_types):
+            pool.failure(self.proxy)
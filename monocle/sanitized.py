@@ -20,6 +20,8 @@ worker_count = config.GRID[0] * config.GRID[1]
 _valid_types = {
     'ACCOUNTS': set_sequence,
     'ACCOUNTS_CSV': path,
+    'ACCOUNT_POOL': int,
+    'ADAPTIVE_COROUTINES': sequence,
     'ALT_PRECISION': int,
     'ALT_RANGE': sequence,
     'ALWAYS_NOTIFY': int,
@@ -30,22 +32,29 @@ _valid_types = {
     'AUTHKEY': bytes,
     'BALANCE': str,
     'BOOTSTRAP_RADIUS': Number,
+    'BOOTSTRAP_SPARSE': int,
     'BOUNDARIES': object,
     'CACHE_CELLS': bool,
     'CAPTCHAS_ALLOWED': int,
     'CAPTCHA_KEY': str,
+    'CATCH_UP': Number,
     'COMPLETE_TUTORIAL': bool,
     'COROUTINES_LIMIT': int,
+    'CPU_PROCESSES': int,
     'DARK_MAP_OPACITY': Number,
     'DARK_MAP_PROVIDER_ATTRIBUTION': str,
     'DARK_MAP_PROVIDER_URL': str,
     'DB': dict,
     'DB_ENGINE': str,
+    'DELTA_GMO': bool,
+    'DENSITY_PLACEMENT': bool,
     'DIRECTORY': path,
     'DISCORD_INVITE_ID': str,
     'DISPLAY_BOOSTED_FEATURE': bool,
+    'ELASTIC_WORKERS': sequence,
     'ENCOUNTER': str,
     'ENCOUNTER_IDS': set_sequence_range,
+    'ENCOUNTER_QUEUE': Number,
     'FAILURES_ALLOWED': int,
     'FAVOR_CAPTCHA': bool,
     'FB_PAGE_ID': str,
@@ -59,16 +68,20 @@ _valid_types = {
     'GOOGLE_MAPS_KEY': str,
     'GRID': sequence,
     'GYM_COOLDOWN': Number,
+    'GYM_INFO_QUEUE': bool,
     'GYM_POINTS': bool,
     'GYM_WEBHOOK': bool,
     'HASHTAGS': set_sequence,
     'HASH_KEY': (str,) + set_sequence,
+    'HASH_SCHEDULER': bool,
     'HEATMAP': bool,
     'IGNORE_IVS': bool,
     'IGNORE_RARITY': bool,
     'IMAGE_STATS': bool,
     'INCUBATE_EGGS': bool,
+    'INFER_SPAWNS': bool,
     'INITIAL_SCORE': Number,
+    'IO_THREADS': int,
     'ITEM_LIMITS': dict,
     'IV_FONT': str,
     'LANDMARKS': object,
@@ -91,6 +104,7 @@ _valid_types = {
     'MAP_WORKERS': bool,
     'MAX_CAPTCHAS': int,
     'MAX_RETRIES': int,
+    'MAX_SCAN_DELAY': Number,
     'MINIMUM_RUNTIME': Number,
     'MINIMUM_SCORE': Number,
     'MORE_POINTS': bool,
@@ -114,12 +128,14 @@ _valid_types = {
     'RAID_IDS': set_sequence_range,
     'RARE_IDS': set_sequence_range,
     'RARITY_OVERRIDE': dict,
+    'REBALANCE_INTERVAL': Number,
     'REFRESH_RATE': Number,
     'REPORT_MAPS': bool,
     'REPORT_SINCE': datetime,
     'RESCAN_UNKNOWN': Number,
     'SCAN_DELAY': Number,
     'SEARCH_SLEEP': Number,
+    'SHARD_LEASE': Number,
     'SHOW_FORM': bool,
     'SHOW_FORM_MENU_ITEM': bool,
     'SHOW_RAID_TIMER': bool,
@@ -139,6 +155,7 @@ _valid_types = {
     'SHOW_WEATHER_BY_DEFAULT': bool,
     'SIMULTANEOUS_LOGINS': int,
     'SIMULTANEOUS_SIMULATION': int,
+    'SKIP_FRESH': bool,
     'SKIP_SPAWN': Number,
     'SMART_THROTTLE': Number,
     'SPAWN_ID_INT': bool,
@@ -155,6 +172,7 @@ _valid_types = {
     'TICKER_ITEMS': str,
     'TICKER_COLOR': str,
     'TIME_REQUIRED': Number,
+    'TOKEN_REFRESH': Number,
     'TRASH_IDS': set_sequence_range,
     'TWEET_IMAGES': bool,
     'TWITTER_ACCESS_KEY': str,
@@ -164,12 +182,17 @@ _valid_types = {
     'TWITTER_SCREEN_NAME': str,
     'TZ_OFFSET': Number,
     'UVLOOP': bool,
-    'WEBHOOKS': set_sequence
+    'WARM_POOL': int,
+    'WATCHDOG': Number,
+    'WEBHOOKS': set_sequence,
+    'WORKER_QUEUES': int
 }
 
 _defaults = {
     'ACCOUNTS': None,
     'ACCOUNTS_CSV': None,
+    'ACCOUNT_POOL': 20,
+    'ADAPTIVE_COROUTINES': None,
     'ALT_PRECISION': 2,
     'ALT_RANGE': (300, 400),
     'ALWAYS_NOTIFY': 0,
@@ -180,21 +203,28 @@ _defaults = {
     'AUTHKEY': b'm3wtw0',
     'BALANCE': None,
     'BOOTSTRAP_RADIUS': 120,
+    'BOOTSTRAP_SPARSE': 1,
     'BOUNDARIES': None,
     'CACHE_CELLS': False,
     'CAPTCHAS_ALLOWED': 3,
     'CAPTCHA_KEY': None,
+    'CATCH_UP': 0,
     'COMPLETE_TUTORIAL': False,
     'CONTROL_SOCKS': None,
     'COROUTINES_LIMIT': worker_count,
+    'CPU_PROCESSES': 1,
     'DARK_MAP_OPACITY': 1.0,
     'DARK_MAP_PROVIDER_ATTRIBUTION': '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors',
     'DARK_MAP_PROVIDER_URL': '//{s}.tile.openstreetmap.org/{z}/{x}/{y}.png',
+    'DELTA_GMO': False,
+    'DENSITY_PLACEMENT': False,
     'DIRECTORY': '.',
     'DISCORD_INVITE_ID': None,
     'DISPLAY_BOOSTED_FEATURE': True,
+    'ELASTIC_WORKERS': None,
     'ENCOUNTER': None,
     'ENCOUNTER_IDS': None,
+    'ENCOUNTER_QUEUE': 0,
     'FAVOR_CAPTCHA': True,
     'FAILURES_ALLOWED': 2,
     'FB_PAGE_ID': None,
@@ -207,14 +237,18 @@ _defaults = {
     'GOOD_ENOUGH': 0.1,
     'GOOGLE_MAPS_KEY': '',
     'GYM_COOLDOWN': 300,
+    'GYM_INFO_QUEUE': False,
     'GYM_POINTS': False,
     'GYM_WEBHOOK': False,
     'HASHTAGS': None,
+    'HASH_SCHEDULER': False,
     'IGNORE_IVS': False,
     'IGNORE_RARITY': False,
     'IMAGE_STATS': False,
     'INCUBATE_EGGS': True,
+    'INFER_SPAWNS': False,
     'INITIAL_RANKING': None,
+    'IO_THREADS': 4,
     'ITEM_LIMITS': None,
     'IV_FONT': 'monospace',
     'LANDMARKS': None,
@@ -235,6 +269,7 @@ _defaults = {
     'MAP_WORKERS': True,
     'MAX_CAPTCHAS': 0,
     'MAX_RETRIES': 3,
+    'MAX_SCAN_DELAY': None,
     'MINIMUM_RUNTIME': 10,
     'MORE_POINTS': True,
     'MOTD': None,
@@ -257,12 +292,14 @@ _defaults = {
     'RAID_IDS': (),
     'RARE_IDS': (),
     'RARITY_OVERRIDE': {},
+    'REBALANCE_INTERVAL': 0,
     'REFRESH_RATE': 0.6,
     'REPORT_MAPS': True,
     'REPORT_SINCE': None,
     'RESCAN_UNKNOWN': 90,
     'SCAN_DELAY': 10,
     'SEARCH_SLEEP': 2.5,
+    'SHARD_LEASE': 120,
     'SHOW_FORM': True,
     'SHOW_FORM_MENU_ITEM': False,
     'SHOW_RAID_TIMER': False,
@@ -282,6 +319,7 @@ _defaults = {
     'SHOW_WEATHER_BY_DEFAULT': False,
     'SIMULTANEOUS_LOGINS': 2,
     'SIMULTANEOUS_SIMULATION': 4,
+    'SKIP_FRESH': False,
     'SKIP_SPAWN': 90,
     'SMART_THROTTLE': False,
     'SPAWN_ID_INT': True,
@@ -298,6 +336,7 @@ _defaults = {
     'TICKER_ITEMS': None,
     'TICKER_COLOR': 'red',
     'TIME_REQUIRED': 300,
+    'TOKEN_REFRESH': None,
     'TRASH_IDS': (),
     'TWEET_IMAGES': False,
     'TWITTER_ACCESS_KEY': None,
@@ -307,7 +346,10 @@ _defaults = {
     'TWITTER_SCREEN_NAME': None,
     'TZ_OFFSET': None,
     'UVLOOP': True,
-    'WEBHOOKS': None
+    'WARM_POOL': 0,
+    'WATCHDOG': None,
+    'WEBHOOKS': None,
+    'WORKER_QUEUES': 0
 }
 
 
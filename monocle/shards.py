@@ -0,0 +1,31 @@
+from os import environ
+
+from . import sanitized as conf
+
+# scan.py --shards N starts each child with MONOCLE_SHARD set to 'index/count'
+try:
+    index, count = (int(x) for x in environ['MONOCLE_SHARD'].split('/'))
+    child = True
+except KeyError:
+    index, count = 0, 1
+    child = False
+# the scan.py process which claimed this shard's region from the Coordinator
+host = environ.get('MONOCLE_HOST')
+
+if not 0 <= index < count:
+    raise ValueError('MONOCLE_SHARD must be index/count with index < count.')
+
+# GRID workers are split between the shards, numbered like a single process
+_total = conf.GRID[0] * conf.GRID[1]
+if count > _total:
+    raise ValueError('There are more shards than the {} GRID workers.'.format(_total))
+worker_count = _total // count + (index < _total % count)
+first_worker = index * (_total // count) + min(index, _total % count)
+# the first number for workers added later by ELASTIC_WORKERS, each shard
+# takes every count-th number after that so they can't run into each other
+extra_workers = _total + index
+
+
+def pickle_folder():
+    """Subfolder of 'pickles' for this shard's spawns and caches"""
+    return 'shard{}-{}'.format(index, count) if child else ''
@@ -1,5 +1,5 @@
 from logging import getLogger, LoggerAdapter
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from time import time
 from asyncio import get_event_loop
 
@@ -7,6 +7,7 @@ from aiohttp import ClientSession
 from aiopogo import json_dumps
 from aiopogo.session import SESSIONS
 
+from . import sanitized as conf
 from .utils import load_accounts
 
 
@@ -75,6 +76,74 @@ def call_at(when, cb, *args):
     return call_later(delay, cb, *args)
 
 
-async def run_threaded(cb, *args):
-    with ThreadPoolExecutor(max_workers=1) as x:
-        return await LOOP.run_in_executor(x, cb, *args)
+def _timed(cb, *args):
+    start = time()
+    return cb(*args), start, time()
+
+
+class Executor:
+    """A named pool shared by everything that runs blocking calls in it
+
+    The pool is started on first use. Tasks that find every worker busy
+    wait in its queue, which is counted to show how saturated it is.
+    """
+    def __init__(self, name, pool_class, workers):
+        self.name = name
+        self.pool_class = pool_class
+        self.workers = workers
+        self.pool = None
+        # submitted and not finished yet
+        self.pending = 0
+        self.busiest = 0
+        self.completed = 0
+        self.failed = 0
+        # tasks that had to wait for a worker
+        self.queued = 0
+        # total seconds spent waiting for a worker, and running
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    def __str__(self):
+        done = self.completed or 1
+        return ('{} executor: {} workers, {} pending (max {}), {:.0%} queued, '
+                'wait {:.0f} ms, run {:.0f} ms, {} failed').format(
+            self.name, self.workers, self.pending, self.busiest,
+            self.queued / done, self.wait_time / done * 1000,
+            self.run_time / done * 1000, self.failed)
+
+    async def run(self, cb, *args):
+        if self.pool is None:
+            self.pool = self.pool_class(max_workers=self.workers)
+        if self.pending >= self.workers:
+            self.queued += 1
+        self.pending += 1
+        self.busiest = max(self.busiest, self.pending)
+        submitted = time()
+        try:
+            result, start, end = await LOOP.run_in_executor(self.pool, _timed, cb, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.wait_time += max(start - submitted, 0)
+        self.run_time += end - start
+        return result
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+
+# 'io' for calls that wait on disk, the database or other processes, 'cpu'
+# for number crunching, which needs picklable module-level functions
+EXECUTORS = {
+    'io': Executor('io', ThreadPoolExecutor, conf.IO_THREADS),
+    'cpu': Executor('cpu', ProcessPoolExecutor, conf.CPU_PROCESSES)
+}
+
+
+async def run_threaded(cb, *args, executor='io'):
+    return await EXECUTORS[executor].run(cb, *args)
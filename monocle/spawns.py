@@ -22,6 +22,8 @@ class BaseSpawns:
         ## Spawns with unknown times
         # {(lat, lon)}
         self.unknown = set()
+        # {(lat, lon): (first_seconds, last_seconds)} from mystery sightings
+        self.windows = {}
 
         self.class_version = 3
         self.db_hash = sha256(conf.DB_ENGINE.encode()).digest()
@@ -45,6 +47,7 @@ class BaseSpawns:
                                      db.Spawnpoint.lon >= bounds.west,
                                      db.Spawnpoint.lon <= bounds.east)
             known = {}
+            unknown_ids = {}
             for spawn in query:
                 point = spawn.lat, spawn.lon
 
@@ -54,16 +57,74 @@ class BaseSpawns:
 
                 if not spawn.updated or spawn.updated <= last_migration:
                     self.unknown.add(point)
+                    unknown_ids[point] = spawn.spawn_id
                     continue
 
-                if spawn.duration == 60:
-                    spawn_time = spawn.despawn_time
-                else:
-                    spawn_time = (spawn.despawn_time + 1800) % 3600
+                # duration is None for 30 minute spawns
+                duration = (spawn.duration or 30) * 60
+                spawn_time = (spawn.despawn_time + 3600 - duration) % 3600
 
                 self.despawn_times[spawn.spawn_id] = spawn.despawn_time
+                self.unknown.discard(point)
                 known[point] = spawn.spawn_id, spawn_time
+
+            windows = db.get_mystery_windows(session)
         self.known = OrderedDict(sorted(known.items(), key=lambda k: k[1][1]))
+        self.windows = {point: windows[spawn_id]
+                        for point, spawn_id in unknown_ids.items()
+                        if spawn_id in windows}
+
+    def infer(self):
+        with db.session_scope() as session:
+            inferred, ambiguous = db.infer_spawn_times(session)
+        if inferred or ambiguous:
+            self.log.warning('Inferred {} spawn times from mystery sightings, {} still ambiguous.',
+                             inferred, ambiguous)
+
+    def mystery_order(self, points, now=None, _time=time):
+        """Sort points by how soon they are likely to reveal their timer
+
+        A spawn's timer is only revealed in the last 90 seconds, so despawn is
+        expected between the last second it was seen and 30 minutes after the
+        first second it was seen. Points within that window now come first,
+        closing soonest first, followed by the rest in order of how soon their
+        window opens. Points without history are spread across the hour.
+        """
+        now = now or _time() % 3600
+        windows = self.windows
+
+        def key(point):
+            try:
+                first, last = windows[point]
+            except KeyError:
+                return 1, time_until_time(hash(point) % 3600, now)
+            start = last % 3600
+            length = max(first + 1800 - last, 90)
+            until_start = time_until_time(start, now)
+            if until_start > 3600 - length:
+                # window is open, return how long until it closes
+                return 0, until_start + length - 3600
+            return 1, until_start
+        return sorted(points, key=key)
+
+    def mystery_schedule(self, points, resort=60, _time=time):
+        """Yield points in mystery_order, sorted again as time passes
+
+        Windows open and close while the points are being visited, so the
+        remaining ones are re-sorted against the clock every resort seconds.
+        Points that are no longer in points, like spawns whose time has been
+        found, are skipped.
+        """
+        # reversed, so that the next point can be popped off the end
+        remaining = self.mystery_order(points)[::-1]
+        sorted_at = _time()
+        while remaining:
+            if _time() - sorted_at > resort:
+                remaining = self.mystery_order(remaining)[::-1]
+                sorted_at = _time()
+            point = remaining.pop()
+            if point in points:
+                yield point
 
     def after_last(self):
         try:
@@ -104,6 +165,7 @@ class BaseSpawns:
         state = self.__dict__.copy()
         del state['log']
         state.pop('cells_count', None)
+        state.pop('index', None)
         state['bounds_hash'] = hash(bounds)
         state['last_migration'] = conf.LAST_MIGRATION
         dump_pickle('spawns', state)
@@ -137,8 +199,7 @@ class Spawns(BaseSpawns):
         return result
 
     def mystery_gen(self):
-        for mystery in self.unknown.copy():
-            yield mystery
+        yield from self.mystery_schedule(self.unknown)
 
 
 class MoreSpawns(BaseSpawns):
@@ -150,6 +211,30 @@ class MoreSpawns(BaseSpawns):
         # {(lat, lon)}
         self.cell_points = set()
 
+        ## Quantized coordinates of all known, unknown and cell points
+        # {(lat_e6, lon_e6)}
+        self.index = set()
+
+    @staticmethod
+    def quantize(point, _round=round):
+        """Round coordinates to ~0.1m so float noise doesn't matter"""
+        return _round(point[0] * 1e6), _round(point[1] * 1e6)
+
+    def rebuild_index(self):
+        quantize = self.quantize
+        self.index = {quantize(p) for p in
+                      chain(self.cell_points, self.known, self.unknown)}
+
+    def update(self):
+        super().update()
+        self.rebuild_index()
+
+    def unpickle(self):
+        result = super().unpickle()
+        if result:
+            self.rebuild_index()
+        return result
+
     def items(self):
         # return a copy since it may be modified
         return self.known.copy().items()
@@ -160,17 +245,23 @@ class MoreSpawns(BaseSpawns):
         self.known[point] = None
         self.unknown.discard(point)
         self.cell_points.discard(point)
+        self.index.add(self.quantize(point))
 
     def add_unknown(self, point):
         self.unknown.add(point)
         self.cell_points.discard(point)
+        self.index.add(self.quantize(point))
+
+    def add_cell_point(self, point):
+        self.cell_points.add(point)
+        self.index.add(self.quantize(point))
 
     def have_point(self, point):
-        return point in chain(self.cell_points, self.known, self.unknown)
+        return self.quantize(point) in self.index
 
     def mystery_gen(self):
-        for mystery in chain(self.unknown.copy(), self.cell_points.copy()):
-            yield mystery
+        yield from self.mystery_schedule(self.unknown)
+        yield from self.mystery_schedule(self.cell_points)
 
     @property
     def cells_count(self):
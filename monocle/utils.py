@@ -1,10 +1,10 @@
 import socket
 
-from os import mkdir
+from os import environ, makedirs
 from os.path import join, exists
 from sys import platform
 from asyncio import sleep
-from math import sqrt
+from math import sqrt, cos, radians
 from uuid import uuid4
 from enum import Enum
 from csv import DictReader
@@ -17,7 +17,8 @@ from geopy.distance import distance
 from aiopogo import utilities as pgoapi_utils
 from pogeo import get_distance
 
-from . import bounds, sanitized as conf
+from . import bounds, shards, sanitized as conf
+from .account_store import AccountStore
 
 
 IPHONES = {'iPhone5,1': 'N41AP',
@@ -62,6 +63,8 @@ def percentage_split(seq, percentages):
 def get_start_coords(worker_no, grid=conf.GRID, bounds=bounds):
     """Returns center of square for given worker"""
     per_column = int((grid[0] * grid[1]) / grid[0])
+    # wrap around rather than start outside of bounds
+    worker_no %= grid[0] * grid[1]
 
     column = worker_no % per_column
     row = int(worker_no / per_column)
@@ -72,6 +75,62 @@ def get_start_coords(worker_no, grid=conf.GRID, bounds=bounds):
     return start_lat, start_lon
 
 
+def weighted_kmeans(points, weights, k, iterations=12):
+    """Returns k cluster centers of weighted points and the weight of each
+
+    Distances are approximated on a plane with longitude scaled to the
+    latitude of the first point, which is fine at city scale. Centers are
+    seeded k-means++ style so dense areas get more of them.
+    """
+    k = min(k, len(points))
+    if not k:
+        return [], []
+    scale = cos(radians(points[0][0]))
+
+    def dist(a, b):
+        return (a[0] - b[0]) ** 2 + ((a[1] - b[1]) * scale) ** 2
+
+    centers = [points[max(range(len(points)), key=weights.__getitem__)]]
+    nearest = [dist(p, centers[0]) for p in points]
+    while len(centers) < k:
+        target = uniform(0, sum(d * w for d, w in zip(nearest, weights)))
+        total = 0
+        for p, d, w in zip(points, nearest, weights):
+            total += d * w
+            if total >= target:
+                break
+        centers.append(p)
+        nearest = [min(n, dist(q, p)) for n, q in zip(nearest, points)]
+
+    for _ in range(iterations):
+        sums = [[0.0, 0.0, 0.0] for _ in centers]
+        for p, w in zip(points, weights):
+            i = min(range(k), key=lambda c: dist(p, centers[c]))
+            sums[i][0] += p[0] * w
+            sums[i][1] += p[1] * w
+            sums[i][2] += w
+        moved = [(lat / total, lon / total) if total else center
+                 for (lat, lon, total), center in zip(sums, centers)]
+        if moved == centers:
+            break
+        centers = moved
+    return centers, [total for _, _, total in sums]
+
+
+def sparse_points(points, results, keep):
+    """Keep only 1 in every keep points whose nearest result saw nothing
+
+    results is {(lat, lon): things seen}. Meant for the cpu executor, since
+    every point is compared with every result.
+    """
+    sampled = []
+    for n, point in enumerate(points):
+        nearest = min(results, key=lambda p: get_distance(p, point))
+        if results[nearest] or n % keep == 0:
+            sampled.append(point)
+    return sampled
+
+
 def float_range(start, end, step):
     """range for floats, also capable of iterating backwards"""
     if start > end:
@@ -111,7 +170,6 @@ def get_bootstrap_points(bounds):
         return coords
     lat_gain, lon_gain = get_gains(conf.BOOTSTRAP_RADIUS)
     west, east = bounds.west, bounds.east
-    bound = bool(bounds)
     for map_row, lat in enumerate(
         float_range(bounds.south, bounds.north, lat_gain)
     ):
@@ -119,9 +177,10 @@ def get_bootstrap_points(bounds):
         if map_row % 2 != 0:
             row_start_lon -= 0.5 * lon_gain
         for lon in float_range(row_start_lon, east, lon_gain):
-            point = lat, lon
-            if not bound or point in bounds:
-                coords.append(point)
+            coords.append((lat, lon))
+    if bounds:
+        coords = [point for point, inside in zip(coords, bounds.contains_many(coords))
+                  if inside]
     shuffle(coords)
     return coords
 
@@ -251,6 +310,10 @@ def time_until_time(seconds, seen=None, _time=time):
 
 
 def get_address():
+    # set by scan.py --join for its shards
+    if 'MONOCLE_MANAGER' in environ:
+        host, port = environ['MONOCLE_MANAGER'].rsplit(':', 1)
+        return host, int(port)
     if conf.MANAGER_ADDRESS:
         return conf.MANAGER_ADDRESS
     if platform == 'win32':
@@ -260,8 +323,15 @@ def get_address():
     return ('127.0.0.1', 5001)
 
 
+def pickle_folder(name):
+    # accounts are shared, everything else is specific to a shard's area
+    if name == 'accounts':
+        return join(conf.DIRECTORY, 'pickles')
+    return join(conf.DIRECTORY, 'pickles', shards.pickle_folder())
+
+
 def load_pickle(name, raise_exception=False):
-    location = join(conf.DIRECTORY, 'pickles', '{}.pickle'.format(name))
+    location = join(pickle_folder(name), '{}.pickle'.format(name))
     try:
         with open(location, 'rb') as f:
             return pickle_load(f)
@@ -273,11 +343,9 @@ def load_pickle(name, raise_exception=False):
 
 
 def dump_pickle(name, var):
-    folder = join(conf.DIRECTORY, 'pickles')
+    folder = pickle_folder(name)
     try:
-        mkdir(folder)
-    except FileExistsError:
-        pass
+        makedirs(folder, exist_ok=True)
     except Exception as e:
         raise OSError("Failed to create 'pickles' folder, please create it manually") from e
 
@@ -287,24 +355,27 @@ def dump_pickle(name, var):
 
 
 def load_accounts():
-    pickled_accounts = load_pickle('accounts')
+    store = AccountStore(join(conf.DIRECTORY, 'accounts.sqlite'))
+    stored_accounts = store.load()
+    # accounts used to be pickled, read the pickle if they haven't been stored
+    pickled_accounts = stored_accounts or load_pickle('accounts')
 
     if conf.ACCOUNTS_CSV:
         accounts = load_accounts_csv()
         if pickled_accounts and set(pickled_accounts) == set(accounts):
-            return pickled_accounts
+            accounts = pickled_accounts
         else:
             accounts = accounts_from_csv(accounts, pickled_accounts)
     elif conf.ACCOUNTS:
         if pickled_accounts and set(pickled_accounts) == set(acc[0] for acc in conf.ACCOUNTS):
-            return pickled_accounts
+            accounts = pickled_accounts
         else:
             accounts = accounts_from_config(pickled_accounts)
     else:
         raise ValueError('Must provide accounts in a CSV or your config file.')
 
-    dump_pickle('accounts', accounts)
-    return accounts
+    store.replace(accounts, save=accounts is not stored_accounts)
+    return store
 
 
 def load_accounts_csv():
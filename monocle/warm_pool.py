@@ -0,0 +1,121 @@
+from asyncio import sleep, CancelledError
+from collections import deque
+from itertools import count
+from queue import Empty
+from time import time
+
+from aiopogo import exceptions as ex
+
+from .shared import get_logger, LOOP
+from .worker import Worker, CaptchaException
+
+
+class WarmPool:
+    """Accounts logged in ahead of swaps, so a worker can scan right away
+
+    Spare workers log in and run the app simulation in the background,
+    limited by the same semaphores as everything else. A worker that needs
+    a new account adopts a spare instead of logging in. Spares are logged in
+    again before their token expires, so adopted accounts can be used for at
+    least margin seconds.
+    """
+    def __init__(self, size, margin=600, interval=5):
+        self.size = size
+        # seconds a token must still be valid for a spare to be adopted
+        self.margin = margin
+        self.interval = interval
+        self.spares = deque()
+        self.warming = 0
+        # spares aren't scanning workers, so number them separately
+        self.numbers = count(-1, -1)
+        self.running = True
+        self.adopted = 0
+        self.failed = 0
+        self.log = get_logger('warm_pool')
+
+    def __len__(self):
+        return len(self.spares)
+
+    def __str__(self):
+        return 'Warm pool: {} ready, {} warming, {} adopted, {} failed'.format(
+            len(self.spares), self.warming, self.adopted, self.failed)
+
+    @staticmethod
+    def expiry(spare):
+        try:
+            return spare.api.auth_provider._access_token_expiry
+        except AttributeError:
+            # unknown, so assume it's good until the next check
+            return time() + 3600
+
+    def take(self):
+        """Returns a logged in spare worker, or None if none are ready"""
+        soon = time() + self.margin
+        while self.spares:
+            spare = self.spares.popleft()
+            if spare.authenticated and self.expiry(spare) > soon:
+                self.adopted += 1
+                return spare
+            LOOP.create_task(self.warm(spare))
+        return None
+
+    async def run(self):
+        while self.running:
+            soon = time() + self.margin * 1.5
+            for spare in tuple(self.spares):
+                if self.expiry(spare) < soon:
+                    self.spares.remove(spare)
+                    LOOP.create_task(self.warm(spare))
+            while (len(self.spares) + self.warming < self.size
+                    and not Worker.extra_queue.empty()):
+                try:
+                    # not the CAPTCHA queue, like Worker would fall back to
+                    account = Worker.extra_queue.get_nowait()
+                except Empty:
+                    break
+                spare = Worker(worker_no=next(self.numbers), account=account)
+                LOOP.create_task(self.warm(spare))
+            await sleep(self.interval, loop=LOOP)
+
+    async def warm(self, spare):
+        self.warming += 1
+        try:
+            if spare.authenticated:
+                # a new token, the app simulation is still valid
+                if not await spare.login(reauth=True):
+                    raise ex.AuthException('reauth failed')
+            else:
+                await spare.login()
+            spare.update_accounts_dict()
+            if self.running:
+                self.spares.append(spare)
+            else:
+                spare.release_account()
+        except CancelledError:
+            spare.release_account()
+            raise
+        except ex.BannedAccountException:
+            self.failed += 1
+            self.log.warning('{} is banned', spare.username)
+            spare.account['banned'] = True
+            spare.update_accounts_dict()
+        except CaptchaException:
+            self.failed += 1
+            spare.account['captcha'] = True
+            spare.update_accounts_dict()
+            Worker.captcha_queue.put(spare.account)
+        except Exception as e:
+            self.failed += 1
+            self.log.warning('{} while warming up {}', e.__class__.__name__, spare.username)
+            spare.release_account()
+        finally:
+            self.warming -= 1
+
+    def stop(self):
+        """Stop warming and give back the accounts of the spares"""
+        self.running = False
+        while self.spares:
+            self.spares.popleft().release_account()
+
+    def accounts(self):
+        return [spare.account for spare in self.spares]
@@ -1,8 +1,8 @@
-from asyncio import gather, Lock, Semaphore, sleep, CancelledError
+from asyncio import gather, shield, Lock, Queue, Semaphore, sleep, CancelledError
 from collections import deque
+from functools import wraps
 from time import time, monotonic
 from queue import Empty
-from itertools import cycle
 from sys import exit
 from distutils.version import StrictVersion
 
@@ -13,8 +13,10 @@ from pogeo import get_distance
 
 from .db import FORT_CACHE, RAID_CACHE, MYSTERY_CACHE, SIGHTING_CACHE, FORT_NAMES_CACHE, WEATHER_CACHE
 from .utils import round_coords, load_pickle, get_device_info, get_start_coords, Units, randomize_point
-from .shared import get_logger, LOOP, SessionManager, run_threaded, ACCOUNTS
-from . import altitudes, avatar, bounds, db_proc, spawns, sanitized as conf
+from .shared import get_logger, LOOP, SessionManager, ACCOUNTS
+from . import altitudes, avatar, bounds, db_proc, freshness, hash_scheduler, spawns, sanitized as conf
+from .pacing import Pacing
+from .proxies import ProxyPool
 
 import s2sphere
 
@@ -46,11 +48,41 @@ UNIT = _unit.value
 del _unit
 
 
+def operation(name):
+    """Record that the worker is doing name while the method runs
+
+    The outermost operation runs in a task of its own, so Watchdog can
+    cancel it without cancelling the caller, which gets a StalledException.
+    """
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            if self.operation is not None:
+                # nested operations count towards the outermost one
+                with Operation(self, name):
+                    return await method(self, *args, **kwargs)
+            with Operation(self, name):
+                task = self.task = LOOP.create_task(method(self, *args, **kwargs))
+                try:
+                    return await shield(task, loop=LOOP)
+                except CancelledError:
+                    if not task.cancelled():
+                        # the caller was cancelled, not the operation
+                        task.cancel()
+                        raise
+                    raise StalledException('{} took too long'.format(name)) from None
+                finally:
+                    self.task = None
+        return wrapper
+    return decorator
+
+
 class Worker:
     """Single worker walking on the map"""
 
     download_hash = ''
     scan_delay = conf.SCAN_DELAY if conf.SCAN_DELAY >= 10 else 10
+    max_scan_delay = max(conf.MAX_SCAN_DELAY or 0, scan_delay)
     g = {'seen': 0, 'captchas': 0}
 
     if conf.CACHE_CELLS:
@@ -75,29 +107,36 @@ class Worker:
     if conf.PROXIES:
         if len(conf.PROXIES) > 1:
             multiproxy = True
-        proxies = cycle(conf.PROXIES)
+        proxies = ProxyPool(conf.PROXIES,
+                            failures=(ex.ProxyException, ex.TimeoutException),
+                            bans=(ex.NianticIPBannedException,))
     else:
         proxies = None
 
     if conf.NOTIFY:
         notifier = Notifier()
 
-    def __init__(self, worker_no):
+    def __init__(self, worker_no, account=None):
         self.worker_no = worker_no
         self.log = get_logger('worker-{}'.format(worker_no))
         # account information
-        try:
-            self.account = self.extra_queue.get_nowait()
-        except Empty as e:
+        if account is not None:
+            self.account = account
+        else:
             try:
-                self.account = self.captcha_queue.get_nowait()
+                self.account = self.extra_queue.get_nowait()
             except Empty as e:
-                raise ValueError("You don't have enough accounts for the number of workers specified in GRID.") from e
+                try:
+                    self.account = self.captcha_queue.get_nowait()
+                except Empty as e:
+                    raise ValueError("You don't have enough accounts for the number of workers specified in GRID.") from e
         self.username = self.account['username']
         try:
             self.location = self.account['location'][:2]
         except KeyError:
             self.location = get_start_coords(worker_no)
+        # where the Overseer would like this worker to be, if anywhere
+        self.home = None
         self.altitude = None
         # last time of any request
         self.last_request = self.account.get('time', 0)
@@ -119,6 +158,11 @@ class Worker:
         self.initialize_api()
         # State variables
         self.busy = Lock(loop=LOOP)
+        if conf.WORKER_QUEUES:
+            # points assigned to this worker, consumed by Overseer.worker_loop
+            self.queue = Queue(maxsize=conf.WORKER_QUEUES, loop=LOOP)
+            # location of the last queued point, used to assign the next one
+            self.queue_tail = self.location
         # Other variables
         self.after_spawn = 0
         self.speed = 0
@@ -130,15 +174,25 @@ class Worker:
         self.next_spin = 0
         self.handle = HandleStub()
         self.next_gym = 0
+        # set once the account has been given back for good
+        self.retired = False
+        # what the worker is doing, since when and the task doing it, for Watchdog
+        self.operation = None
+        self.operation_start = 0
+        self.task = None
 
     def initialize_api(self):
         device_info = get_device_info(self.account)
         self.empty_visits = 0
+        # times operations were cancelled for taking too long, since a visit
+        self.stalls = 0
+        self.pacing = Pacing(self.scan_delay, self.max_scan_delay,
+                             self.account.get('pacing'))
 
         self.api = PGoApi(device_info=device_info)
         self.api.set_position(*self.location, self.altitude)
         if self.proxies:
-            self.api.proxy = next(self.proxies)
+            self.api.proxy = self.proxies.get()
         try:
             if self.account['provider'] == 'ptc' and 'auth' in self.account:
                 self.api.auth_provider = AuthPtc(username=self.username, password=self.account['password'], timeout=conf.LOGIN_TIMEOUT)
@@ -150,12 +204,13 @@ class Worker:
             pass
 
     def swap_proxy(self):
-        proxy = self.api.proxy
-        while proxy == self.api.proxy:
-            self.api.proxy = next(self.proxies)
+        self.api.proxy = self.proxies.get(exclude=self.api.proxy)
 
+    @operation('login')
     async def login(self, reauth=False):
         """Logs worker in and prepares for scanning"""
+        if self.retired:
+            return False
         self.log.info('Trying to log in')
 
         for attempt in range(-1, conf.MAX_RETRIES):
@@ -482,7 +537,7 @@ class Worker:
                         else:
                             self.unused_incubators.appendleft(item)
 
-    async def call(self, request, chain=True, stamp=True, buddy=True, settings=False, inbox=True, dl_hash=True, action=None):
+    async def call(self, request, chain=True, stamp=True, buddy=True, settings=False, inbox=True, dl_hash=True, action=None, priority=hash_scheduler.GMO):
         if chain:
             request.check_challenge()
             request.get_hatched_eggs()
@@ -508,9 +563,19 @@ class Worker:
 
         response = None
         err = None
+        timeouts = 0
         for attempt in range(-1, conf.MAX_RETRIES):
+            if self.multiproxy and self.proxies.quarantined(self.api.proxy):
+                # failed for this or other workers since it was picked
+                self.swap_proxy()
             try:
-                responses = await request.call()
+                if conf.HASH_SCHEDULER:
+                    await hash_scheduler.acquire(priority)
+                if self.proxies:
+                    with self.proxies.track(self.api.proxy):
+                        responses = await request.call()
+                else:
+                    responses = await request.call()
                 self.last_request = time()
                 err = None
                 break
@@ -525,7 +590,13 @@ class Worker:
                 if not isinstance(e, type(err)):
                     err = e
                     self.log.warning('{}', e)
-                await sleep(10, loop=LOOP)
+                self.pacing.failure()
+                timeouts += 1
+                if self.multiproxy and timeouts > 1:
+                    self.log.warning('{} timed out again, swapping proxy.', self.api.proxy)
+                    self.swap_proxy()
+                    timeouts = 0
+                await self.backoff_sleep(10, 10)
             except ex.HashingOfflineException as e:
                 if not isinstance(e, type(err)):
                     err = e
@@ -543,6 +614,10 @@ class Worker:
                     err = e
                     self.log.warning('Exceeded your hashing quota, sleeping.')
                 self.error_code = 'QUOTA EXCEEDED'
+                if conf.HASH_SCHEDULER:
+                    # wait for a token on the next attempt instead of sleeping
+                    hash_scheduler.exceeded()
+                    continue
                 refresh = HashServer.status.get('period')
                 now = time()
                 if refresh:
@@ -560,7 +635,8 @@ class Worker:
                     err = e
                     self.log.warning('{}', e)
                 self.error_code = 'INVALID REQUEST'
-                await self.random_sleep()
+                self.pacing.failure()
+                await self.backoff_sleep()
             except ex.ProxyException as e:
                 if not isinstance(e, type(err)):
                     err = e
@@ -578,7 +654,8 @@ class Worker:
                 if not isinstance(e, type(err)):
                     self.log.warning('{}', e)
                 self.error_code = 'MALFORMED RESPONSE'
-                await self.random_sleep()
+                self.pacing.failure()
+                await self.backoff_sleep()
         if err is not None:
             raise err
 
@@ -624,25 +701,31 @@ class Worker:
 
     def travel_speed(self, point):
         '''Fast calculation of travel speed to point'''
-        time_diff = max(time() - self.last_request, self.scan_delay)
+        time_diff = max(time() - self.last_request, self.pacing.delay)
         distance = get_distance(self.location, point, UNIT)
         # conversion from seconds to hours
         speed = (distance / time_diff) * 3600
         return speed
 
     async def bootstrap_visit(self, point):
+        """Returns the number of things seen, 0 if every attempt failed"""
         for _ in range(3):
-            if await self.visit(point, bootstrap=True):
-                return True
+            seen = await self.visit(point, bootstrap=True)
+            if seen:
+                return seen
             self.error_code = 'B'
             self.simulate_jitter(0.00005)
-        return False
+        return 0
 
+    @operation('visit')
     async def visit(self, point, spawn_id=None, bootstrap=False):
         """Wrapper for self.visit_point - runs it a few times before giving up
 
         Also is capable of restarting in case an error occurs.
         """
+        if self.retired:
+            # waited on the busy lock while the account was given back
+            return False
         try:
             try:
                 self.altitude = altitudes.get(point)
@@ -746,17 +829,23 @@ class Worker:
         start = time()
 
         cell_ids = self.get_cell_ids(point)
-        since_timestamp_ms = (0,) * len(cell_ids)
+        if conf.DELTA_GMO:
+            since_timestamp_ms = freshness.since(cell_ids)
+        else:
+            since_timestamp_ms = (0,) * len(cell_ids)
         request = self.api.create_request()
         request.get_map_objects(cell_id=cell_ids,
                                 since_timestamp_ms=since_timestamp_ms,
                                 latitude=point[0],
                                 longitude=point[1])
 
-        diff = self.last_gmo + self.scan_delay - time()
+        diff = self.last_gmo + self.pacing.delay - time()
         if diff > 0:
             await sleep(diff, loop=LOOP)
-        responses = await self.call(request)
+        call_start = monotonic()
+        responses = await self.call(request, priority=hash_scheduler.GMO_KNOWN
+                                    if spawn_id else hash_scheduler.GMO)
+        call_time = monotonic() - call_start
         self.last_gmo = self.last_request
 
         try:
@@ -765,15 +854,23 @@ class Worker:
             if map_objects.status != 1:
                 error = 'GetMapObjects code for {}. Speed: {:.2f}'.format(self.username, self.speed)
                 self.empty_visits += 1
+                self.pacing.failure()
                 if self.empty_visits > 3:
                     reason = '{} empty visits'.format(self.empty_visits)
                     await self.swap_account(reason)
                 raise ex.UnexpectedResponseException(error)
         except KeyError:
-            await self.random_sleep(.5, 1)
+            self.pacing.failure()
+            await self.backoff_sleep(.5, 1)
             await self.get_player()
             raise ex.UnexpectedResponseException('Missing GetMapObjects response.')
 
+        if conf.SKIP_FRESH:
+            freshness.record(cell_ids, point, self.last_gmo)
+        if conf.DELTA_GMO:
+            freshness.measure(map_objects, any(since_timestamp_ms), call_time)
+            since_timestamp_ms = dict(zip(cell_ids, since_timestamp_ms))
+
         pokemon_seen = 0
         forts_seen = 0
         points_seen = 0
@@ -795,6 +892,11 @@ class Worker:
                     if (encounter_conf == 'all'
                             or (encounter_conf == 'some'
                             and normalized['pokemon_id'] in conf.ENCOUNTER_IDS)):
+                        if conf.ENCOUNTER_QUEUE:
+                            # saved and notified once it has been encountered
+                            self.encounter_queue.put(
+                                normalized, pokemon.spawn_point_id, map_objects.time_of_day)
+                            continue
                         try:
                             await self.encounter(normalized, pokemon.spawn_point_id)
                         except CancelledError:
@@ -818,7 +920,11 @@ class Worker:
                     LOOP.create_task(self.notifier.notify(normalized, map_objects.time_of_day))
                 db_proc.add(normalized)
 
-            for fort in map_cell.forts:
+            if conf.DELTA_GMO:
+                forts = freshness.merge(map_cell, since_timestamp_ms.get(map_cell.s2_cell_id))
+            else:
+                forts = map_cell.forts
+            for fort in forts:
                 if not fort.enabled:
                     continue
                 forts_seen += 1
@@ -845,7 +951,10 @@ class Worker:
                         if conf.PULL_GYM_NAME:
                             # Check if gym name is in FORT_NAMES_CACHE
                             name = FORT_NAMES_CACHE.get_name(fort.id)
-                            if name == '':
+                            if name == '' and conf.GYM_INFO_QUEUE:
+                                # fetched by an idle worker, saved as a fort_name
+                                self.gym_info_queue.put(gyms)
+                            elif name == '':
                                 await self.get_gym_name(gyms)
                                 gymName = self.normalize_gym_name(fort)
                                 gymName['name'] = gyms['name']
@@ -873,7 +982,7 @@ class Worker:
                         p = p.latitude, p.longitude
                         if spawns.have_point(p) or p not in bounds:
                             continue
-                        spawns.cell_points.add(p)
+                        spawns.add_cell_point(p)
                 except KeyError:
                     pass
                     
@@ -898,17 +1007,21 @@ class Worker:
             self.total_seen += pokemon_seen
             self.g['seen'] += pokemon_seen
             self.empty_visits = 0
+            self.pacing.success()
         else:
             self.empty_visits += 1
             if forts_seen == 0:
                 self.log.warning('Nothing seen by {}. Speed: {:.2f}', self.username, self.speed)
                 self.error_code = '0 SEEN'
+                self.pacing.failure()
             else:
+                self.pacing.success()
                 self.error_code = ','
             if self.empty_visits > 3 and not bootstrap:
                 reason = '{} empty visits'.format(self.empty_visits)
                 await self.swap_account(reason)
         self.visits += 1
+        self.stalls = 0
 
         if conf.MAP_WORKERS:
             self.worker_dict.update([(self.worker_no,
@@ -936,7 +1049,10 @@ class Worker:
         except (TypeError, KeyError):
             return False
 
+    @operation('gym')
     async def get_gym_name(self, gym):
+        if self.retired:
+            return
         # randomize location up to ~1.4 meters
         self.simulate_jitter(amount=0.00001)
         
@@ -948,7 +1064,7 @@ class Worker:
                                 gym_lat_degrees=gym['lat'],
                                 gym_lng_degrees=gym['lon']
                             )
-        responses = await self.call(request, action=1.2) # Changed from action=1.2
+        responses = await self.call(request, action=1.2, priority=hash_scheduler.GYM) # Changed from action=1.2
         try:
             if responses['GYM_GET_INFO'].result != 1:
                 self.log.warning("Failed to get gym_info {}", gym['external_id'])
@@ -979,7 +1095,7 @@ class Worker:
         request.fort_details(fort_id = pokestop.id,
                              latitude = pokestop_location[0],
                              longitude = pokestop_location[1])
-        responses = await self.call(request, action=1.2)
+        responses = await self.call(request, action=1.2, priority=hash_scheduler.SPIN)
         name = responses['FORT_DETAILS'].name
 
         request = self.api.create_request()
@@ -988,7 +1104,7 @@ class Worker:
                             player_longitude = self.location[1],
                             fort_latitude = pokestop_location[0],
                             fort_longitude = pokestop_location[1])
-        responses = await self.call(request, action=2)
+        responses = await self.call(request, action=2, priority=hash_scheduler.SPIN)
 
         try:
             result = responses['FORT_SEARCH'].result
@@ -1017,7 +1133,10 @@ class Worker:
         self.next_spin = time() + conf.SPIN_COOLDOWN
         self.error_code = '!'
 
+    @operation('encounter')
     async def encounter(self, pokemon, spawn_id):
+        if self.retired:
+            return
         distance_to_pokemon = get_distance(self.location, (pokemon['lat'], pokemon['lon']))
 
         self.error_code = '~'
@@ -1044,7 +1163,7 @@ class Worker:
                                     player_latitude=self.location[0],
                                     player_longitude=self.location[1])
 
-        responses = await self.call(request, action=2.25)
+        responses = await self.call(request, action=2.25, priority=hash_scheduler.ENCOUNTER)
 
         try:
             pdata = responses['ENCOUNTER'].wild_pokemon.pokemon_data
@@ -1077,7 +1196,7 @@ class Worker:
         for item, count in rec_items.items():
             request = self.api.create_request()
             request.recycle_inventory_item(item_id=item, count=count)
-            responses = await self.call(request, action=2)
+            responses = await self.call(request, action=2, priority=hash_scheduler.SPIN)
 
             try:
                 if responses['RECYCLE_INVENTORY_ITEM'].result != 1:
@@ -1103,7 +1222,7 @@ class Worker:
             if inc.item_id == 901 or egg.egg_km_walked_target > 9:
                 request = self.api.create_request()
                 request.use_item_egg_incubator(item_id=inc.id, pokemon_id=egg.id)
-                responses = await self.call(request, action=4.5)
+                responses = await self.call(request, action=4.5, priority=hash_scheduler.INCUBATE)
 
                 try:
                     ret = responses['USE_ITEM_EGG_INCUBATOR'].result
@@ -1117,6 +1236,7 @@ class Worker:
 
         self.unused_incubators = incubators
 
+    @operation('captcha')
     async def handle_captcha(self, challenge_url):
         if self.num_captchas >= conf.CAPTCHAS_ALLOWED:
             self.log.error("{} encountered too many CAPTCHAs, removing.", self.username)
@@ -1194,6 +1314,7 @@ class Worker:
         self.account['location'] = self.location
         self.account['time'] = self.last_request
         self.account['inventory_timestamp'] = self.inventory_timestamp
+        self.account['pacing'] = self.pacing.state
         if self.player_level:
             self.account['level'] = self.player_level
 
@@ -1222,6 +1343,8 @@ class Worker:
 
     async def lock_and_swap(self, minutes):
         async with self.busy:
+            if self.retired:
+                return
             self.error_code = 'SWAPPING'
             h, m = divmod(int(minutes), 60)
             if h:
@@ -1229,10 +1352,26 @@ class Worker:
             else:
                 timestr = '{}m'.format(m)
             self.log.warning('Swapping {} which had been running for {}.', self.username, timestr)
-            self.update_accounts_dict()
-            self.extra_queue.put(self.account)
+            self.release_account()
             await self.new_account()
 
+    async def retire(self):
+        """Give the account back for good, the worker won't be used again"""
+        async with self.busy:
+            if self.retired:
+                return
+            # anything still waiting on the lock bails out instead of
+            # using the account, which another worker may have by then
+            self.retired = True
+            self.error_code = 'RETIRED'
+            self.log.warning('Retiring {}, it is not needed right now.', self.username)
+            self.handle.cancel()
+            self.release_account()
+
+    def release_account(self):
+        self.update_accounts_dict()
+        self.extra_queue.put(self.account)
+
     async def swap_account(self, reason=''):
         self.error_code = 'SWAPPING'
         self.log.warning('Swapping out {} because {}.', self.username, reason)
@@ -1240,21 +1379,24 @@ class Worker:
         self.extra_queue.put(self.account)
         await self.new_account()
 
+    @operation('swapping')
     async def new_account(self):
+        if conf.WARM_POOL:
+            spare = self.warm_pool.take()
+            if spare:
+                self.adopt(spare)
+                return
         if (conf.CAPTCHA_KEY
                 and (conf.FAVOR_CAPTCHA or self.extra_queue.empty())
                 and not self.captcha_queue.empty()):
-            self.account = self.captcha_queue.get()
+            self.account = await self.captcha_queue.get()
         else:
-            try:
-                self.account = self.extra_queue.get_nowait()
-            except Empty:
-                self.account = await run_threaded(self.extra_queue.get)
+            self.account = await self.extra_queue.get()
         self.username = self.account['username']
         try:
             self.location = self.account['location'][:2]
         except KeyError:
-            self.location = get_start_coords(self.worker_no)
+            self.location = self.home or get_start_coords(self.worker_no)
         self.inventory_timestamp = self.account.get('inventory_timestamp', 0) if self.items else 0
         self.player_level = self.account.get('level')
         self.last_request = self.account.get('time', 0)
@@ -1272,6 +1414,17 @@ class Worker:
         self.initialize_api()
         self.error_code = None
 
+    def adopt(self, spare):
+        """Take over the logged in account of a spare from the WarmPool"""
+        for attr in ('account', 'username', 'api', 'location', 'altitude',
+                     'last_request', 'last_action', 'last_gmo', 'items',
+                     'bag_items', 'inventory_timestamp', 'player_level',
+                     'item_capacity', 'num_captchas', 'eggs',
+                     'unused_incubators', 'empty_visits', 'pacing'):
+            setattr(self, attr, getattr(spare, attr))
+        self.log.info('Adopted {}, which is already logged in.', self.username)
+        self.error_code = None
+
     def unset_code(self):
         self.error_code = None
 
@@ -1412,6 +1565,10 @@ class Worker:
         """Sleeps for a bit"""
         await sleep(uniform(minimum, maximum), loop=loop)
 
+    async def backoff_sleep(self, minimum=10.1, maximum=14):
+        """Sleeps for a bit after an error, longer if the account is struggling"""
+        await sleep(self.pacing.backoff(minimum, maximum), loop=LOOP)
+
     @property
     def start_time(self):
         return self.api.start_time
@@ -1443,6 +1600,24 @@ class HandleStub:
         pass
 
 
+class Operation:
+    __slots__ = ('worker', 'name', 'previous')
+
+    def __init__(self, worker, name):
+        self.worker = worker
+        self.name = name
+
+    def __enter__(self):
+        worker = self.worker
+        self.previous = worker.operation
+        worker.operation = self.name
+        if self.previous is None:
+            worker.operation_start = monotonic()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.worker.operation = self.previous
+
+
 class EmptyGMOException(Exception):
     """Raised when the GMO response is empty."""
 
@@ -1453,3 +1628,7 @@ class CaptchaException(Exception):
 
 class CaptchaSolveException(Exception):
     """Raised when solving a CAPTCHA has failed."""
+
+
+class StalledException(Exception):
+    """Raised when Watchdog cancelled an operation that took too long."""
@@ -14,21 +14,26 @@ from multiprocessing.managers import BaseManager, DictProxy
 from queue import Queue, Full
 from argparse import ArgumentParser
 from signal import signal, SIGINT, SIGTERM, SIG_IGN
-from logging import getLogger, basicConfig, WARNING, INFO
+from logging import getLogger, basicConfig, INFO
 from logging.handlers import RotatingFileHandler
-from os.path import exists, join
-from sys import platform
-from time import monotonic, sleep
+from os import environ, getpid
+from os.path import abspath, exists, join
+from subprocess import Popen, TimeoutExpired
+from datetime import datetime
+from socket import gethostname
+from sys import executable, exit, platform
+from time import monotonic, sleep, time
 
 from sqlalchemy.exc import DBAPIError
 from aiopogo import close_sessions, activate_hash_server
 
-from monocle.shared import LOOP, get_logger, SessionManager, ACCOUNTS
+from monocle.shared import LOOP, get_logger, SessionManager, ACCOUNTS, EXECUTORS
 from monocle.utils import get_address, dump_pickle
 from monocle.worker import Worker
-from monocle.overseer import Overseer
+from monocle.overseer import Overseer, ANSI
+from monocle.coordinator import Coordinator
 from monocle.db import FORT_CACHE, RAID_CACHE, FORT_NAMES_CACHE, WEATHER_CACHE
-from monocle import altitudes, db_proc, spawns
+from monocle import altitudes, db_proc, shards, spawns
 
 
 class AccountManager(BaseManager):
@@ -61,6 +66,7 @@ class CustomQueue(Queue):
 _captcha_queue = CustomQueue()
 _extra_queue = Queue()
 _worker_dict = {}
+_coordinator = None
 
 def get_captchas():
     return _captcha_queue
@@ -71,8 +77,13 @@ def get_extras():
 def get_workers():
     return _worker_dict
 
-def mgr_init():
+def get_coordinator():
+    return _coordinator
+
+def mgr_init(regions=1, lease=conf.SHARD_LEASE):
+    global _coordinator
     signal(SIGINT, SIG_IGN)
+    _coordinator = Coordinator(regions, _extra_queue, ACCOUNTS, lease)
 
 
 def parse_args():
@@ -86,7 +97,7 @@ def parse_args():
     parser.add_argument(
         '--log-level',
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
-        default=WARNING
+        default='WARNING'
     )
     parser.add_argument(
         '--bootstrap',
@@ -100,6 +111,22 @@ def parse_args():
         help='Do not load spawns from pickle',
         action='store_false'
     )
+    parser.add_argument(
+        '--shards',
+        type=int,
+        default=1,
+        help='Split the area into this many regions, each scanned by its own process'
+    )
+    parser.add_argument(
+        '--processes',
+        type=int,
+        help='Scan this many regions on this host, defaults to all of them or 1 with --join'
+    )
+    parser.add_argument(
+        '--join',
+        metavar='HOST:PORT',
+        help='Scan regions claimed from the scan.py --shards at this address'
+    )
     return parser.parse_args()
 
 
@@ -128,8 +155,9 @@ def exception_handler(loop, context):
 
 def cleanup(overseer, manager):
     try:
-        overseer.print_handle.cancel()
-        overseer.running = False
+        if overseer.print_handle:
+            overseer.print_handle.cancel()
+        overseer.stop()
         print('Exiting, please wait until all tasks finish')
 
         log = get_logger('cleanup')
@@ -146,10 +174,15 @@ def cleanup(overseer, manager):
             log.exception('A wild {} appeared during exit!', e.__class__.__name__)
 
         db_proc.stop()
-        overseer.refresh_dict()
+        if shards.child:
+            # the coordinator saves accounts once every shard has stopped
+            return_accounts(overseer)
+        else:
+            overseer.refresh_dict()
 
         print('Dumping pickles...')
-        dump_pickle('accounts', ACCOUNTS)
+        if not shards.child:
+            ACCOUNTS.flush()
         FORT_CACHE.pickle()
         RAID_CACHE.pickle()
         FORT_NAMES_CACHE.pickle()
@@ -167,17 +200,157 @@ def cleanup(overseer, manager):
             sleep(.5)
     finally:
         print('Closing pipes, sessions, and event loop...')
-        manager.shutdown()
+        if not shards.child:
+            manager.shutdown()
         SessionManager.close()
         close_sessions()
+        for executor in EXECUTORS.values():
+            executor.shutdown()
         LOOP.close()
         print('Done.')
 
 
+def return_accounts(overseer):
+    if overseer.region_lost:
+        # the coordinator already queued its accounts again
+        return
+    for worker in overseer.workers:
+        worker.release_account()
+    overseer.extra_queue.flush()
+    overseer.captcha_queue.flush()
+    # banned accounts aren't queued, but the ban must be saved
+    overseer.coordinator.save(
+        [account for account in ACCOUNTS.values() if account.get('banned')])
+    overseer.coordinator.release(shards.host, shards.index)
+
+
+def print_shards(coordinator, manager, _start=datetime.now()):
+    running_for = datetime.now() - _start
+    seconds_since_start = running_for.total_seconds() or 0.1
+    regions, count, expired = coordinator.status()
+    columns = ('workers', 'visits', 'skipped', 'known', 'unknown', 'seen', 'db_queue')
+    row = '{:>6} {:>8} {:>9} {:>8} {:>7} {:>8} {:>9} {:>9}  {}'
+    output = [
+        '{}Monocle scanning {} of {} regions for {}'.format(
+            ANSI, len(regions), count, running_for),
+        row.format('Region', 'Workers', 'Visits', 'Skipped', 'Known', 'Unknown', 'Seen', 'DB queue', 'Host')
+    ]
+    totals = dict.fromkeys(columns, 0)
+    for index in range(count):
+        try:
+            shard = regions[index]
+        except KeyError:
+            output.append('{:>6} unclaimed'.format(index))
+            continue
+        if 'updated' not in shard:
+            output.append('{:>6} starting  {}'.format(index, shard['host']))
+            continue
+        for column in columns:
+            totals[column] += shard[column]
+        line = row.format(index, *(shard[column] for column in columns), shard['host'])
+        if time() - shard['updated'] > 60:
+            line += ' (not responding)'
+        output.append(line)
+    output.append(row.format('Total', *(totals[column] for column in columns), ''))
+    output.append('')
+    output.append('Expired leases: {}'.format(expired))
+    output.append('Visits per second: {:.2f}, seen per minute: {:.0f}'.format(
+        totals['visits'] / seconds_since_start,
+        totals['seen'] / (seconds_since_start / 60)))
+    output.append('Extra accounts: {}, CAPTCHAs needed: {}'.format(
+        manager.extra_queue().qsize(), manager.captcha_queue().qsize()))
+    print('\n'.join(output))
+
+
+def sigterm_handler(signum, frame):
+    exit()
+
+
+def coordinate(args, manager):
+    """Run scan.py processes for regions claimed from the Coordinator"""
+    log = get_logger('coordinator')
+    coordinator = manager.coordinator()
+    if not args.join:
+        Overseer.queue_accounts(manager.captcha_queue(), manager.extra_queue())
+    host = '{}:{}'.format(gethostname(), getpid())
+    processes = args.processes
+    if processes is None:
+        processes = 1 if args.join else args.shards
+
+    command = [executable, abspath(__file__), '--no-status-bar',
+               '--log-level', args.log_level]
+    if args.bootstrap:
+        command.append('--bootstrap')
+    if not args.pickle:
+        command.append('--no-pickle')
+    # {region: Popen}
+    children = {}
+
+    signal(SIGTERM, sigterm_handler)
+    try:
+        while True:
+            for region, child in tuple(children.items()):
+                if child.poll() is not None:
+                    # its lease expires unless it was released on exit
+                    log.error('Shard {} exited with code {}.', region, child.returncode)
+                    del children[region]
+            while len(children) < processes:
+                claim = coordinator.claim(host)
+                if not claim:
+                    break
+                region, regions = claim
+                env = dict(environ, MONOCLE_SHARD='{}/{}'.format(region, regions),
+                           MONOCLE_HOST=host)
+                children[region] = Popen(command, env=env)
+                log.warning('Started shard {} of {}.', region, regions)
+            if args.status_bar:
+                try:
+                    print_shards(coordinator, manager)
+                except Exception as e:
+                    log.exception('{} occurred while printing status.', e.__class__.__name__)
+            sleep(conf.REFRESH_RATE)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        print('Waiting for shards to exit...')
+        children = tuple(children.values())
+        for child in children:
+            if child.poll() is None:
+                if platform == 'win32':
+                    child.terminate()
+                else:
+                    child.send_signal(SIGINT)
+        for child in children:
+            try:
+                child.wait(90)
+            except TimeoutExpired:
+                log.error('Shard did not exit in time, killing it.')
+                child.kill()
+
+        if not args.join:
+            # hosts that joined this one can't continue without its manager
+            print('Dumping accounts...')
+            for queue in (manager.extra_queue(), manager.captcha_queue()):
+                while not queue.empty():
+                    account = queue.get()
+                    ACCOUNTS[account['username']] = account
+            ACCOUNTS.update(coordinator.get_saved())
+            ACCOUNTS.flush()
+            manager.shutdown()
+        print('Done.')
+
+
 def main():
     args = parse_args()
+    if args.shards > conf.GRID[0] * conf.GRID[1]:
+        print('--shards can be at most the number of GRID workers, {}.'.format(
+            conf.GRID[0] * conf.GRID[1]))
+        return
     log = get_logger()
-    if args.status_bar:
+    if shards.child:
+        configure_logger(filename=join(
+            conf.DIRECTORY, 'scan-shard{}.log'.format(shards.index)))
+    elif args.status_bar:
         configure_logger(filename=join(conf.DIRECTORY, 'scan.log'))
         log.info('-' * 37)
         log.info('Starting up!')
@@ -190,20 +363,31 @@ def main():
     if conf.MAP_WORKERS:
         AccountManager.register('worker_dict', callable=get_workers,
                                 proxytype=DictProxy)
+    AccountManager.register('coordinator', callable=get_coordinator)
+    if args.join:
+        # for this process and the shards it starts
+        environ['MONOCLE_MANAGER'] = args.join
     address = get_address()
     manager = AccountManager(address=address, authkey=conf.AUTHKEY)
-    try:
-        manager.start(mgr_init)
-    except (OSError, EOFError) as e:
-        if platform == 'win32' or not isinstance(address, str):
-            raise OSError('Another instance is running with the same manager address. Stop that process or change your MANAGER_ADDRESS.') from e
-        else:
-            raise OSError('Another instance is running with the same socket. Stop that process or: rm {}'.format(address)) from e
+    if shards.child or args.join:
+        # queues are served by the coordinator's manager
+        manager.connect()
+    else:
+        try:
+            manager.start(mgr_init, (args.shards, conf.SHARD_LEASE))
+        except (OSError, EOFError) as e:
+            if platform == 'win32' or not isinstance(address, str):
+                raise OSError('Another instance is running with the same manager address. Stop that process or change your MANAGER_ADDRESS.') from e
+            else:
+                raise OSError('Another instance is running with the same socket. Stop that process or: rm {}'.format(address)) from e
+
+    if (args.shards > 1 or args.join) and not shards.child:
+        return coordinate(args, manager)
 
     LOOP.set_exception_handler(exception_handler)
 
     overseer = Overseer(manager)
-    overseer.start(args.status_bar)
+    overseer.start(args.status_bar and not shards.child)
     launcher = LOOP.create_task(overseer.launch(args.bootstrap, args.pickle))
     activate_hash_server(conf.HASH_KEY)
     if platform != 'win32':
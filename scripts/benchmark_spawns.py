@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import sys
+from itertools import chain
+from pathlib import Path
+from random import uniform, sample
+from timeit import timeit
+
+monocle_dir = Path(__file__).resolve().parents[1]
+sys.path.append(str(monocle_dir))
+
+from monocle import spawns
+
+# the module is replaced by an instance of either class, get MoreSpawns from
+# the globals of a method both have, whatever MORE_POINTS is set to
+MoreSpawns = spawns.add_known.__globals__['MoreSpawns']
+
+POINTS = 100000
+LOOKUPS = 10000
+
+more = MoreSpawns()
+points = [(uniform(40.0, 40.2), uniform(-74.2, -74.0)) for _ in range(POINTS)]
+third = POINTS // 3
+for n, point in enumerate(points[:third]):
+    more.add_known(n, n % 3600, point)
+for point in points[third:third * 2]:
+    more.add_unknown(point)
+for point in points[third * 2:]:
+    more.add_cell_point(point)
+
+present = sample(points, LOOKUPS // 2)
+missing = [(uniform(40.0, 40.2), uniform(-74.2, -74.0)) for _ in range(LOOKUPS // 2)]
+lookups = present + missing
+
+
+def chained(points):
+    for p in points:
+        p in chain(more.cell_points, more.known, more.unknown)
+
+
+def indexed(points):
+    for p in points:
+        more.have_point(p)
+
+
+assert all(more.have_point(p) for p in present)
+assert not any(more.have_point(p) for p in missing)
+
+# a linear scan is slow enough that a small sample is plenty
+sampled = lookups[::LOOKUPS // 200]
+chain_time = timeit(lambda: chained(sampled), number=1) / len(sampled)
+index_time = timeit(lambda: indexed(lookups), number=1) / len(lookups)
+
+print('{} points'.format(POINTS))
+print('chain: {:.2f}µs per lookup'.format(chain_time * 1e6))
+print('index: {:.2f}µs per lookup'.format(index_time * 1e6))
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+
+import sys
+from pathlib import Path
+
+monocle_dir = Path(__file__).resolve().parents[1]
+sys.path.append(str(monocle_dir))
+
+from monocle.db import session_scope, infer_spawn_times
+
+with session_scope() as session:
+    inferred, ambiguous = infer_spawn_times(session)
+print('Inferred {} spawn times, {} ambiguous.'.format(inferred, ambiguous))
@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 
-from pickle import load
+import sys
+
 from pprint import PrettyPrinter
 from pathlib import Path
 from datetime import datetime
 
-pickle_path = Path(__file__).resolve().parents[1] / 'pickles' / 'accounts.pickle'
+monocle_dir = Path(__file__).resolve().parents[1]
+sys.path.append(str(monocle_dir))
+
+from monocle.account_store import AccountStore
 
-with pickle_path.open('rb') as f:
-    accounts = load(f)
+accounts = AccountStore(str(monocle_dir / 'accounts.sqlite')).load() or {}
 
 for account in accounts.values():
     if 'time' in account:
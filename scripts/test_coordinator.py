@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Exercise the Coordinator with several local host processes
+
+Serves a Coordinator on a local port like scan.py --shards does, then
+starts host processes that claim regions and send heartbeats. One host
+stops sending them partway through, its region must be claimed by another
+host once the lease expires and its accounts must be queued again, in the
+state sent with the last heartbeat.
+"""
+
+import sys
+
+from argparse import ArgumentParser
+from multiprocessing import Process
+from multiprocessing.managers import BaseManager
+from pathlib import Path
+from queue import Queue, Empty
+from time import sleep, time
+
+monocle_dir = Path(__file__).resolve().parents[1]
+sys.path.append(str(monocle_dir))
+
+from monocle.coordinator import Coordinator
+
+AUTHKEY = b'test'
+
+
+class TestManager(BaseManager):
+    pass
+
+
+_extra_queue = Queue()
+_coordinator = None
+
+
+def get_extras():
+    return _extra_queue
+
+
+def get_coordinator():
+    return _coordinator
+
+
+def init(regions, lease, accounts):
+    global _coordinator
+    _coordinator = Coordinator(regions, _extra_queue, accounts, lease)
+
+
+TestManager.register('extra_queue', callable=get_extras)
+TestManager.register('coordinator', callable=get_coordinator)
+
+
+def run_host(name, port, accounts_per_region, duration, crash_after=None):
+    manager = TestManager(address=('127.0.0.1', port), authkey=AUTHKEY)
+    manager.connect()
+    coordinator = manager.coordinator()
+    extra_queue = manager.extra_queue()
+    start = time()
+    held = {}
+    while time() - start < duration:
+        if crash_after and time() - start > crash_after:
+            print('{} stopped sending heartbeats'.format(name))
+            return
+        if not held:
+            claim = coordinator.claim(name)
+            if claim:
+                region = claim[0]
+                held[region] = []
+                for _ in range(accounts_per_region):
+                    try:
+                        held[region].append(extra_queue.get(timeout=1))
+                    except Empty:
+                        break
+                print('{} claimed region {} with {} accounts'.format(
+                    name, region, len(held[region])))
+        for region, accounts in tuple(held.items()):
+            for account in accounts:
+                account['heartbeats'] = account.get('heartbeats', 0) + 1
+            if not coordinator.heartbeat(name, region, {'updated': time()}, accounts):
+                print('{} lost region {}'.format(name, region))
+                del held[region]
+        sleep(0.2)
+    for region, accounts in held.items():
+        for account in accounts:
+            extra_queue.put(account)
+        coordinator.release(name, region)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--port', type=int, default=5101)
+    parser.add_argument('--regions', type=int, default=3)
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--lease', type=float, default=2)
+    args = parser.parse_args()
+
+    accounts = {'account{}'.format(n): {'username': 'account{}'.format(n)}
+                for n in range(args.regions * 2)}
+    manager = TestManager(address=('127.0.0.1', args.port), authkey=AUTHKEY)
+    manager.start(init, (args.regions, args.lease, accounts))
+    for account in accounts.values():
+        manager.extra_queue().put(account)
+    coordinator = manager.coordinator()
+
+    duration = args.lease * 5
+    hosts = [Process(target=run_host, args=(
+                 'host{}'.format(n), args.port, 2, duration,
+                 args.lease if n == 0 else None))
+             for n in range(args.hosts)]
+    for host in hosts:
+        host.start()
+        sleep(0.1)
+
+    overlaps = 0
+    end = time() + duration
+    while time() < end:
+        regions, count, expired = coordinator.status()
+        # a dict can't hold one region twice, check the hosts are unique too
+        holders = [stats['host'] for stats in regions.values()]
+        overlaps += len(holders) - len(set(holders))
+        sleep(0.1)
+    for host in hosts:
+        host.join()
+
+    regions, count, expired = coordinator.status()
+    extra_queue = manager.extra_queue()
+    queued = []
+    while not extra_queue.empty():
+        queued.append(extra_queue.get())
+    # every account was used, so none should come back in its initial state
+    stale = sum('heartbeats' not in account for account in queued)
+    print('Expired leases: {}, hosts holding several regions: {}, accounts queued: {}/{}, '
+          'stale: {}'.format(expired, overlaps, len(queued), len(accounts), stale))
+    manager.shutdown()
+    if expired < 1 or overlaps or len(queued) != len(accounts) or stale:
+        print('FAILED')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
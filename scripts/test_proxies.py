@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Exercise the ProxyPool against local fake proxies
+
+Starts proxies that are fast, slow, flaky, IP banned or not listening at
+all, then has simulated workers make requests through proxies picked by
+the pool, swapping proxies on errors like Worker does. The fast proxy
+should get most requests and the broken ones should end up quarantined.
+"""
+
+import asyncio
+import sys
+
+from argparse import ArgumentParser
+from pathlib import Path
+from random import random
+from time import monotonic
+
+monocle_dir = Path(__file__).resolve().parents[1]
+sys.path.append(str(monocle_dir))
+
+from monocle.proxies import ProxyPool
+
+
+class ProxyError(Exception):
+    pass
+
+
+class BannedError(Exception):
+    pass
+
+
+# name: (delay in seconds, chance of dropping the connection, status)
+BEHAVIORS = {
+    'fast': (0.02, 0, 200),
+    'slow': (0.3, 0, 200),
+    'flaky': (0.05, 0.5, 200),
+    'banned': (0.02, 0, 403),
+}
+
+
+def fake_proxy(delay, drop_rate, status):
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # skip headers
+                while line not in (b'\r\n', b'\n', b''):
+                    line = await reader.readline()
+                await asyncio.sleep(delay)
+                if random() < drop_rate:
+                    break
+                writer.write('HTTP/1.1 {} X\r\nContent-Length: 2\r\n\r\nok'.format(
+                    status).encode())
+                await writer.drain()
+        finally:
+            writer.close()
+    return handle
+
+
+async def request(proxy, timeout=1):
+    host, port = proxy.rsplit(':', 1)
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, int(port)), timeout)
+    except (OSError, asyncio.TimeoutError) as e:
+        raise ProxyError(str(e)) from e
+    try:
+        writer.write(b'GET http://example.com/ HTTP/1.1\r\nHost: example.com\r\n\r\n')
+        status = await asyncio.wait_for(reader.readline(), timeout)
+        if not status:
+            raise ProxyError('connection dropped')
+        if b' 403 ' in status:
+            raise BannedError
+        await asyncio.wait_for(reader.read(100), timeout)
+    except asyncio.TimeoutError as e:
+        raise ProxyError('timed out') from e
+    finally:
+        writer.close()
+
+
+async def worker(pool, end, counts):
+    proxy = pool.get()
+    while monotonic() < end:
+        counts[proxy] = counts.get(proxy, 0) + 1
+        try:
+            with pool.track(proxy):
+                await request(proxy)
+        except (ProxyError, BannedError):
+            proxy = pool.get(exclude=proxy)
+        await asyncio.sleep(0.01)
+
+
+async def main(args):
+    servers = []
+    proxies = {}
+    for port, (name, behavior) in enumerate(sorted(BEHAVIORS.items()), args.port):
+        servers.append(await asyncio.start_server(
+            fake_proxy(*behavior), '127.0.0.1', port))
+        proxies[name] = '127.0.0.1:{}'.format(port)
+    # nothing listens here
+    proxies['dead'] = '127.0.0.1:{}'.format(args.port + len(BEHAVIORS))
+
+    pool = ProxyPool(proxies.values(), failures=(ProxyError,), bans=(BannedError,),
+                     backoff=args.duration / 4)
+    counts = {}
+    end = monotonic() + args.duration
+    await asyncio.gather(*(worker(pool, end, counts) for _ in range(args.workers)))
+    for server in servers:
+        server.close()
+
+    print('\n'.join(pool.report()))
+    print(pool)
+    total = sum(counts.values())
+    for name, proxy in sorted(proxies.items()):
+        print('{:>6}: {:.0%} of requests'.format(name, counts.get(proxy, 0) / total))
+    return counts.get(proxies['fast'], 0) == max(counts.values())
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--port', type=int, default=5201)
+    parser.add_argument('--workers', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+    loop = asyncio.get_event_loop()
+    if loop.run_until_complete(main(args)):
+        print('OK')
+    else:
+        print('FAILED')
+        sys.exit(1)